@@ -1,122 +1,235 @@
+import asyncio
 import base64
-import re
+import hashlib
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import quote
 from pydantic import BaseModel
-import requests
-from fastapi import FastAPI, HTTPException, Query, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
-from bs4 import BeautifulSoup
 
-app = FastAPI()
+import assets
+import config
+import http_fetch
+import jobs
+import login_flow
+import metrics
+import parse_pool
+import roster_payload
+import scrape_profiles
+from auth_cache import AuthStateCache
+from browser_pool import BrowserPool, MemoryBudgetError
+from course_cache import CourseListCache
+from matrix_client import MatrixProvisioningClient, memberships_from_courses, merge_reports, user_id_from_email
+from roster_retrieval import fetch_exported_roster, fetch_paged_roster, member_export_url
+from roster_snapshots import SnapshotStore, diff_roster, normalize_roster
+from scrape_profiles import install_scrape_profiles
+from http_fetch import IliasHttpSession, SessionExpiredError
+from jobs import JobQueue
+from metrics import (COURSE_NAVIGATION_SECONDS, DASHBOARD_REDIRECT_SECONDS, FAILURES, LOGIN_PAGE_LOAD_SECONDS,
+                     OTP_WAIT_SECONDS, SCREENSHOT_SECONDS)
+from sessions import SessionStore, session_id_for
+from warm_contexts import WarmContextPool
+
+browser_pool = BrowserPool()
+matrix_client = MatrixProvisioningClient()
+job_queue = JobQueue()
+snapshot_store = SnapshotStore()
+auth_cache = AuthStateCache()
+course_cache = CourseListCache()
+
+@asynccontextmanager
+async def lifespan(app):
+    parse_pool.start()
+    lag_monitor = asyncio.create_task(metrics.monitor_event_loop_lag(config.EVENT_LOOP_LAG_INTERVAL))
+    await browser_pool.start()
+    prewarm_task = asyncio.create_task(prewarm())
+    await job_queue.start()
+    session_data.start_reaper(expire_session)
+    try:
+        yield
+    finally:
+        prewarm_task.cancel()
+        lag_monitor.cancel()
+        await session_data.stop_reaper()
+        await job_queue.stop()
+        for session_id in list(session_data):
+            await cleanup_session(session_id)
+        await warm_contexts.stop()
+        await browser_pool.stop()
+        await http_fetch.close_client()
+        await matrix_client.close()
+        parse_pool.stop()
 
-# Setup templates and static files
-templates = Jinja2Templates(directory="templates")
+app = FastAPI(lifespan=lifespan)
 
-session_data = {}
+ready = asyncio.Event()
+prewarm_seconds = None
 
-async def create_playwright_browser(headless=True):
-    playwright = await async_playwright().start()
-    browser = await playwright.chromium.launch(headless=headless)
-    return browser, playwright
+async def prewarm():
+    """Starts the parser processes and opens the warm login contexts; /ready answers 200 afterwards."""
+    global prewarm_seconds
+    start = time.perf_counter()
+    try:
+        await warm_contexts.start()
+        await asyncio.gather(parse_pool.prewarm(), warm_contexts.ready.wait())
+    except Exception as e:
+        print(f"Prewarm failed: {str(e)}")
+    prewarm_seconds = time.perf_counter() - start
+    ready.set()
+    print(f"Prewarmed {warm_contexts.stats()['warm']} login pages in {prewarm_seconds:.2f} s")
 
-async def capture_screenshot(session_id):
-    if session_id not in session_data:
-        return None
-    if session_data[session_id].get("page"):
-        session_data[session_id]['screenshot'] = await session_data[session_id]["page"].screenshot()
+# Setup templates and static files
+templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset_url"] = assets.asset_url
+
+# Content-hashed copies from `python assets.py` are cached for good, the source files are revalidated
+app.mount(assets.ASSETS_URL, assets.AssetFiles(directory=os.path.join(config.ASSET_BUILD_DIR, "assets"),
+                                               check_dir=False, immutable=True), name="assets")
+for prefix, directory in assets.SOURCE_DIRS.items():
+    app.mount("/" + prefix, assets.AssetFiles(directory=directory), name=prefix)
+
+session_data = SessionStore()
+
+metrics.Gauge('unisync_active_sessions', 'Open browser sessions.', lambda: session_data.stats()['active'])
+metrics.Gauge('unisync_busy_sessions', 'Sessions with a sync running on them.', lambda: session_data.stats()['busy'])
+metrics.Gauge('unisync_browsers_connected', 'Connected Chromium processes in the pool.', lambda: browser_pool.stats()['connected'])
+metrics.Gauge('unisync_browser_contexts', 'Open browser contexts across the pool.', lambda: browser_pool.stats()['contexts'])
+metrics.Gauge('unisync_browser_memory_bytes', 'Resident memory of the browsers at the latest check.', browser_pool.memory_used)
+metrics.Gauge('unisync_warm_contexts', 'Prewarmed contexts waiting on the login form.', lambda: warm_contexts.stats()['warm'])
+
+SCREENSHOT_TYPE = f"image/{config.SCREENSHOT_FORMAT}"
+# A client polling /screenshot counts as watching for this long after its latest request
+SCREENSHOT_POLL_SUBSCRIPTION = 5.0
+
+def screenshot_watched(session):
+    return (session['screenshot_watchers'] > 0
+            or time.monotonic() - session['screenshot_polled'] < SCREENSHOT_POLL_SUBSCRIPTION)
+
+async def encode_screenshot(session):
+    """Captures the visible page downscaled to SCREENSHOT_WIDTH, encoded by Chromium itself.
+
+    Goes through the DevTools protocol because Page.captureScreenshot can
+    scale the frame and encode WebP, which page.screenshot() cannot.
+    """
+    page = session['page']
+    if session['cdp'] is None:
+        session['cdp'] = await session['context'].new_cdp_session(page)
+    viewport = page.viewport_size or {'width': 1280, 'height': 720}
+    scale = min(1.0, config.SCREENSHOT_WIDTH / viewport['width'])
+    with SCREENSHOT_SECONDS.time():
+        result = await session['cdp'].send('Page.captureScreenshot', {
+            'format': config.SCREENSHOT_FORMAT,
+            'quality': config.SCREENSHOT_QUALITY,
+            'clip': {'x': 0, 'y': 0, 'width': viewport['width'], 'height': viewport['height'], 'scale': scale},
+            'optimizeForSpeed': True,
+        })
+    return base64.b64decode(result['data'])
+
+async def screenshot_loop(session_id, session):
+    """Takes frames while someone watches the session: on request, at most one per SCREENSHOT_INTERVAL."""
+    wanted = session['screenshot_wanted']
+    while not session.get('closed') and screenshot_watched(session):
+        wanted.clear()
+        started = time.monotonic()
+        try:
+            frame = await encode_screenshot(session)
+        except Exception as e:
+            print(f"Screenshot of session {session_id} failed: {str(e)}")
+        else:
+            etag = hashlib.sha1(frame).hexdigest()
+            # Chromium encodes an unchanged page to identical bytes, so only real
+            # changes produce a new frame for the watching clients. Only the
+            # latest frame is kept.
+            if etag != session['screenshot_etag']:
+                session['screenshot'] = frame
+                session['screenshot_etag'] = etag
+                await notify_screenshot_watchers(session)
+        await asyncio.sleep(max(0.0, config.SCREENSHOT_INTERVAL - (time.monotonic() - started)))
+        try:
+            await asyncio.wait_for(wanted.wait(), timeout=config.SCREENSHOT_REFRESH or None)
+        except asyncio.TimeoutError:
+            pass
+    session['screenshot_task'] = None
+
+def capture_screenshot(session_id):
+    """Asks for a new frame of the session; does nothing while nobody watches it."""
+    session = session_data.get(session_id)
+    if session is None or session.get('closed') or not screenshot_watched(session):
+        return
+    session['screenshot_wanted'].set()
+    if session['screenshot_task'] is None:
+        session['screenshot_task'] = asyncio.create_task(screenshot_loop(session_id, session))
+
+async def notify_screenshot_watchers(session):
+    async with session['screenshot_changed']:
+        session['screenshot_changed'].notify_all()
+
+LOGIN_URL = (config.LOGIN_BASE_URL + '/realms/hhn/protocol/openid-connect/auth'
+             '?response_mode=form_post&response_type=id_token&redirect_uri=' + quote(config.ILIAS_BASE_URL + '/openidconnect.php', safe='') +
+             '&client_id=hhn_common_ilias&nonce=badc63032679bb541ff44ea53eeccb4e&state=2182e131aa3ed4442387157cd1823be0&scope=openid+openid')
 
 async def navigate_to_login_page(username, password, session_id):
-    login_url = ('https://login.hs-heilbronn.de/realms/hhn/protocol/openid-connect/auth'
-                 '?response_mode=form_post&response_type=id_token&redirect_uri=https%3A%2F%2Filias.hs-heilbronn.de%2Fopenidconnect.php'
-                 '&client_id=hhn_common_ilias&nonce=badc63032679bb541ff44ea53eeccb4e&state=2182e131aa3ed4442387157cd1823be0&scope=openid+openid')
-    await session_data[session_id]['page'].goto(login_url)
-    await session_data[session_id]['page'].fill('input[name="username"]', username)
-    await session_data[session_id]['page'].fill('input[name="password"]', password)
-    await session_data[session_id]['page'].click('input[name="login"]')
-    await session_data[session_id]['page'].wait_for_selector('a[id="try-another-way"]', timeout=6000)
-    await session_data[session_id]['page'].click('a[id="try-another-way"]')
-    await session_data[session_id]['page'].wait_for_selector("button[name='authenticationExecution']:has-text('Enter a verification code from authenticator application.')", timeout=6000)
-    await session_data[session_id]['page'].click("button[name='authenticationExecution']:has-text('Enter a verification code from authenticator application.')")
-
-async def wait_for_dashboard(page):
-    """Waits until redirected to the dashboard after login."""
-    try:
-        await page.wait_for_url("**/ilias.php?baseClass=ilDashboardGUI&cmd=jumpToSelectedItems", timeout=60000)  # Wait up to 60 seconds
-        print("Login successful. Redirecting to the target URL...")
-    except PlaywrightTimeoutError:
-        raise Exception("Login did not complete within the expected time.")
+    """Logs in up to the OTP prompt; returns the login state reached (see login_flow)."""
+    session = session_data[session_id]
+    return await login_flow.log_in(session['page'], LOGIN_URL, username, password, navigate=not session['prewarmed'])
+
+MAIN_COURSES_URL = config.ILIAS_BASE_URL + '/ilias.php?cmdClass=ilmembershipoverviewgui&cmdNode=jr&baseClass=ilmembershipoverviewgui'
+
+def course_membership_url(ref_id):
+    return f"{config.ILIAS_BASE_URL}/ilias.php?baseClass=ilrepositorygui&cmdNode=yc:ml:95&cmdClass=ilCourseMembershipGUI&ref_id={ref_id}"
 
 async def navigate_to_main_courses_page(page):
-    target_url = 'https://ilias.hs-heilbronn.de/ilias.php?cmdClass=ilmembershipoverviewgui&cmdNode=jr&baseClass=ilmembershipoverviewgui'
-    await page.goto(target_url)
-
-def extract_courses(html_content):
-    soup = BeautifulSoup(html_content, 'html.parser')
-    courses = []
-
-    def get_ref_id(url):
-        match = re.search(r'ref_id=(\d+)', url)
-        return match.group(1) if match else ''
-
-    course_rows = soup.select('.il-std-item')
-    for course_row in course_rows:
-        img_element = course_row.select_one('img.icon')
-        if img_element and img_element.get('alt') != 'Symbol Gruppe':
-            course_name_element = course_row.select_one('.il-item-title a')
-            if course_name_element:
-                course_name = course_name_element.get_text(strip=True)
-                course_url = course_name_element.get('href')
-                course_ref_id = get_ref_id(course_url)
-                courses.append({
-                    'name': course_name,
-                    'refId': course_ref_id,
-                    'url': course_url,
-                })
-
-    return courses
-
-def extract_email_column_from_table(html_content):
-    soup = BeautifulSoup(html_content, 'html.parser')
-    table = soup.find('table', {'class': 'table table-striped fullwidth'})
-    email_column_data = []
-
-    if table and table.find('tbody'):
-        for row in table.find('tbody').find_all('tr'):
-            columns = row.find_all('td')
-            if len(columns) >= 5:
-                email_column_data.append(columns[4].text.strip())
-
-    return email_column_data
-
-def send_data_to_matrix_server(user_id, room_name):
-    url = "http://unifyhn.de/add_user_to_rooms"
-    headers = {"Content-Type": "application/json"}
-    data = {
-        "user_id": "@" + user_id + ":unifyhn.de",
-        "rooms": [{"room_name": room_name}]
-    }
-    response = requests.post(url, json=data, headers=headers)
-    return response
+    await page.goto(MAIN_COURSES_URL)
+
+async def send_data_to_matrix_server(user_id, room_name):
+    return await matrix_client.add_user_to_rooms(user_id, [room_name])
 
 async def visit_course_page_and_scrape(page, course):
-    dynamic_url = f"https://ilias.hs-heilbronn.de/ilias.php?baseClass=ilrepositorygui&cmdNode=yc:ml:95&cmdClass=ilCourseMembershipGUI&ref_id={course['refId']}"
+    dynamic_url = course_membership_url(course['refId'])
     print(f"Visiting dynamic URL: {dynamic_url}")
-    await page.goto(dynamic_url)
 
-    course_html_content = await page.content()
-    emails = extract_email_column_from_table(course_html_content)
+    if config.ROSTER_MODE == 'export':
+        http_session = await IliasHttpSession.from_context(page.context)
+        emails = await fetch_exported_roster(http_session.iter_lines(member_export_url(course['refId'])))
+    elif config.ROSTER_MODE == 'paged':
+        async def page_chunks(url):
+            await page.goto(url)
+            yield await page.content()
+
+        emails = await fetch_paged_roster(page_chunks, dynamic_url, parse=parse_pool.parse_roster_stream)
+    else:
+        await page.goto(dynamic_url)
+        course_html_content = await page.content()
+        emails = await parse_pool.extract_email_column_from_table(course_html_content)
     print(f"Email Column Data for {course['name']}:", emails)
 
-    return course_html_content, emails
+    return emails
+
+async def fetch_roster_over_http(http_session, course):
+    dynamic_url = course_membership_url(course['refId'])
+    if config.ROSTER_MODE == 'export':
+        return await fetch_exported_roster(http_session.iter_lines(member_export_url(course['refId'])))
+    if config.ROSTER_MODE == 'paged':
+        return await fetch_paged_roster(http_session.iter_text, dynamic_url, parse=parse_pool.parse_roster_stream)
+    return await parse_pool.extract_email_column_from_table(await http_session.get(dynamic_url))
 
 @app.get("/")
 async def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
+@app.get("/service-worker.js")
+async def service_worker():
+    # Served from the root so it controls every page; browsers check it for updates on each visit
+    return Response(assets.service_worker_source(), media_type="application/javascript",
+                    headers={"Cache-Control": "no-cache"})
+
 @app.get("/sync", response_class=HTMLResponse)
 async def sync(request: Request):
-    """ response = send_data_to_matrix_server('demo_user_1', 'DemoRoom500')
+    """ response = await send_data_to_matrix_server('demo_user_1', 'DemoRoom500')
     print('Response Status Code:', response.status_code, flush=True)
     print('Response Content:', response.text, flush=True)
     try:
@@ -125,38 +238,154 @@ async def sync(request: Request):
         print('Response is not in JSON format', flush=True) """
     return templates.TemplateResponse("login.html", {"request": request})
 
-async def perform_sync_thread(session_id, username, password):
+async def new_page(storage_state=None, profile='login'):
+    context = await browser_pool.new_context(storage_state=storage_state)
+    routing = await install_scrape_profiles(context, profile) if config.SCRAPE_PROFILES else None
+    return context, await context.new_page(), routing
+
+async def open_login_page(url):
+    """Opens a context with its page on the login form, for the warm context pool."""
+    error = browser_pool.memory_error()
+    if error:
+        raise MemoryBudgetError(error)
+    context, page, routing = await new_page()
     try:
-        #browser, playwright = await create_playwright_browser(headless=False)
-        browser, playwright = await create_playwright_browser(headless=True)
-        page = await browser.new_page()
-        session_data[session_id] = {
-            'browser': browser,
-            'page': page,
-            'playwright': playwright,
-            'screenshot': None,
-            'otp_required': False
-        }
-        await capture_screenshot(session_id)
-        await navigate_to_login_page(username, password, session_id)
-        await capture_screenshot(session_id)
+        await page.goto(url)
+    except Exception:
+        await context.close()
+        raise
+    return context, page, routing
 
-        # Check for OTP field
-        try:
-            await session_data[session_id]["page"].wait_for_selector('input[name="otp"]', timeout=3000)
-            session_data[session_id]['otp_required'] = True
-        except PlaywrightTimeoutError:
-            await cleanup_session(session_id)
-            print("Login failed: Invalid credentials")
-        print(f"Thread {session_id} completed initial sync.")
+warm_contexts = WarmContextPool(open_login_page, LOGIN_URL)
+
+async def open_session(session_id, storage_state=None, profile='login', job_id=None):
+    """Opens a fresh BrowserContext and page for the session, replacing any previous one.
+
+    A login takes a prewarmed context already on the login form if one is left.
+    `job_id` is the job that owns the session (see cleanup_session).
+    """
+    await cleanup_session(session_id)
+    warm = warm_contexts.take() if profile == 'login' and storage_state is None else None
+    context, page, routing = warm or await new_page(storage_state, profile)
+    session_data[session_id] = {
+        'context': context,
+        'page': page,
+        'routing': routing,
+        'prewarmed': warm is not None,
+        'job_id': job_id,
+        'screenshot': None,
+        'screenshot_etag': None,
+        'screenshot_changed': asyncio.Condition(),
+        'screenshot_watchers': 0,
+        'screenshot_polled': float('-inf'),
+        'screenshot_wanted': asyncio.Event(),
+        'screenshot_task': None,
+        'cdp': None,
+        'otp_required': False
+    }
+
+async def resume_cached_session(session_id, password, job_id=None):
+    """Opens a session from the cached storage state if ILIAS still accepts it.
+
+    Only the password the state was cached with opens it. The cookies are
+    probed with a single HTTP request before any browser context is created;
+    a rejected state is dropped from the cache.
+    """
+    storage_state = await asyncio.to_thread(auth_cache.load, session_id, password)
+    if storage_state is None:
+        return False
+    try:
+        await IliasHttpSession(storage_state.get('cookies', [])).get(MAIN_COURSES_URL)
+    except SessionExpiredError:
+        print(f"Cached login for {session_id} was rejected, logging in again")
+        await asyncio.to_thread(auth_cache.invalidate, session_id)
+        return False
+    except Exception as e:
+        print(f"Could not probe cached login for {session_id}: {str(e)}")
+        return False
+
+    await open_session(session_id, storage_state=storage_state, profile='scrape', job_id=job_id)
+    return True
+
+async def perform_sync_thread(session_id, username, password, job_id=None):
+    """Opens the session and logs in; raises LoginFailedError with the reason on failure."""
+    # A repeated login for the same user replaces the previous session
+    await open_session(session_id, job_id=job_id)
+    capture_screenshot(session_id)
+    try:
+        with LOGIN_PAGE_LOAD_SECONDS.time():
+            state = await navigate_to_login_page(username, password, session_id)
     except Exception as e:
-        await cleanup_session(session_id)
         print(f"Error in thread {session_id}: {str(e)}")
+        await cleanup_session(session_id, job_id)
+        raise
+    capture_screenshot(session_id)
+    session_data[session_id]['otp_required'] = state == login_flow.OTP_PROMPT
+    print(f"Thread {session_id} completed initial sync.")
+    return state
 
 # Define a Pydantic model for the POST request body
 class SyncRequest(BaseModel):
     username: str
     password: str
+    remember: bool = False
+    refresh_courses: bool = False
+
+async def login_stage(job, username, password, remember=False, refresh_courses=False):
+    job.set_phase(jobs.LOGIN)
+    await session_data.make_room(expire_session)
+    browser_pool.check_memory_budget()
+    if refresh_courses:
+        await asyncio.to_thread(course_cache.invalidate, job.session_id)
+    if not remember:
+        await asyncio.to_thread(auth_cache.forget, job.session_id, password)
+    elif auth_cache.enabled and await resume_cached_session(job.session_id, password, job.id):
+        # Still logged in to ILIAS: no Keycloak form and no OTP needed
+        session_data[job.session_id]['busy'] = True
+        await process_courses(job.session_id, job)
+        job.finish(jobs.DONE)
+        return
+
+    state = await perform_sync_thread(job.session_id, username, password, job.id)
+    session = session_data[job.session_id]
+    if remember and auth_cache.enabled:
+        # Saved once the login has succeeded, without keeping the password
+        session['auth_credentials'] = await asyncio.to_thread(auth_cache.credentials, password)
+    if state == login_flow.DASHBOARD:
+        # Keycloak did not ask for an OTP
+        session['busy'] = True
+        await sync_logged_in_session(job)
+        return
+    session['otp_wait_started'] = time.monotonic()
+    # The idle TTL runs from the OTP prompt, not from the start of the login
+    session_data.touch(job.session_id)
+    job.set_phase(jobs.OTP_WAIT)
+
+async def scrape_stage(job, otp):
+    job.set_phase(jobs.LOGIN)
+    session_id = job.session_id
+    session_data[session_id]['busy'] = True
+    try:
+        with DASHBOARD_REDIRECT_SECONDS.time():
+            await login_flow.submit_otp(session_data[session_id]["page"], otp)
+    finally:
+        capture_screenshot(session_id)
+    await sync_logged_in_session(job)
+
+async def sync_logged_in_session(job):
+    """Scrapes and provisions once the session has reached the ILIAS dashboard."""
+    session_id = job.session_id
+    if session_data[session_id]['routing']:
+        session_data[session_id]['routing'].set_profile('scrape')
+    if session_data[session_id].get('auth_credentials'):
+        storage_state = await session_data[session_id]['context'].storage_state()
+        await asyncio.to_thread(auth_cache.save, session_id, session_data[session_id]['auth_credentials'],
+                                storage_state)
+    await process_courses(session_id, job)
+    job.finish(jobs.DONE)
+
+async def cleanup_job_session(job):
+    await cleanup_session(job.session_id, job.id)
 
 @app.post("/perform-sync")
 async def perform_sync(sync_request: SyncRequest):
@@ -166,9 +395,16 @@ async def perform_sync(sync_request: SyncRequest):
     if not username or not password:
         raise HTTPException(status_code=400, detail="Username and password are required")
 
-    session_id = base64.urlsafe_b64encode(username.encode()).decode()
-    await perform_sync_thread(session_id, username, password)
-    return JSONResponse({"status": "otp_check_started", "session_id": session_id})
+    session_id = session_id_for(username)
+    # Also cancels a job still queued or logging in
+    job_queue.cancel_session(session_id)
+    if session_id in session_data:
+        session_data.touch(session_id)
+    job = job_queue.create(session_id)
+    job_queue.submit(job, lambda job: login_stage(job, username, password, sync_request.remember,
+                                                  sync_request.refresh_courses),
+                     on_error=cleanup_job_session)
+    return JSONResponse({"status": "queued", "session_id": session_id, "job_id": job.id}, status_code=202)
 
 @app.get("/submit-otp")
 async def submit_otp(otp: str = Query(...), session_id: str = Query(...)):
@@ -178,61 +414,463 @@ async def submit_otp(otp: str = Query(...), session_id: str = Query(...)):
     if session_id not in session_data:
         raise HTTPException(status_code=404, detail="Invalid session ID")
 
-    # Check if OTP is required and thread is running
-    if session_data[session_id]['otp_required']:
-        try:
-            await session_data[session_id]["page"].fill('input[name="otp"]', otp)
-            await capture_screenshot(session_id)
-            await session_data[session_id]["page"].click('input[type="submit"]')
-            await capture_screenshot(session_id)
-            await wait_for_dashboard(session_data[session_id]["page"])
-            return await process_courses(session_id)
-        except Exception as e:
-            await cleanup_session(session_id)
-            return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+    session_data.touch(session_id)
+    # Check if OTP is required and the login stage is waiting for it
+    job = job_queue.get(session_data[session_id].get('job_id'))
+    if session_data[session_id]['otp_required'] and job and job.phase == jobs.OTP_WAIT:
+        OTP_WAIT_SECONDS.observe(time.monotonic() - session_data[session_id]['otp_wait_started'])
+        job_queue.submit(job, lambda job: scrape_stage(job, otp), on_error=cleanup_job_session)
+        return JSONResponse({"status": "queued", "session_id": session_id, "job_id": job.id}, status_code=202)
     else:
         return JSONResponse({"status": "error", "message": "OTP not required or session expired"}, status_code=400)
 
-async def process_courses(session_id):
-    await navigate_to_main_courses_page(session_data[session_id]["page"])
-
-    html_content = await session_data[session_id]["page"].content()
-    courses = extract_courses(html_content)
+@app.get("/jobs/{job_id}")
+async def get_job(request: Request, job_id: str, format: str = Query(None)):
+    """Reports the phase and the partial results of a sync job.
+
+    With ?format=compact or an Accept header naming the compact media type,
+    "data" holds the results in the compact format (see roster_payload).
+    Compressed with brotli or gzip when the client accepts it.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return await roster_payload.job_response(request, job.to_dict(), roster_payload.wants_compact(request, format))
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(request: Request, job_id: str, format: str = Query(None)):
+    """Streams one record per course as soon as it is scraped, then a summary record.
+
+    NDJSON by default; server-sent events with ?format=sse or an
+    Accept: text/event-stream header.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    sse = format == "sse" or "text/event-stream" in request.headers.get("accept", "")
+    queue = job.subscribe()
+
+    async def records():
+        try:
+            while True:
+                record = await queue.get()
+                line = json.dumps(record, separators=(",", ":"))
+                yield f"event: {record['type']}\ndata: {line}\n\n" if sse else line + "\n"
+                if record["type"] == "summary":
+                    break
+        finally:
+            job.unsubscribe(queue)
+
+    return StreamingResponse(records(), media_type="text/event-stream" if sse else "application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    if job.task is None:
+        # Not running, so no worker will clean up the browser session
+        await cleanup_session(job.session_id, job.id)
+    return JSONResponse(job.to_dict())
+
+async def scrape_courses(context, first_page, courses, concurrency=None, job=None):
+    """Scrapes the membership page of every course using up to `concurrency` pages.
+
+    The session page is reused as the first worker page; additional pages are
+    opened in the same authenticated context. Results keep the order of `courses`
+    and courses that fail to scrape are left out, as in the sequential loop.
+    """
+    concurrency = max(1, concurrency if concurrency is not None else config.SCRAPE_CONCURRENCY)
+    results = [None] * len(courses)
+    queue = asyncio.Queue()
+    for index, course in enumerate(courses):
+        queue.put_nowait((index, course))
+
+    async def worker(page):
+        while True:
+            try:
+                index, course = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                with COURSE_NAVIGATION_SECONDS.time(path='browser'):
+                    emails = await visit_course_page_and_scrape(page, course)
+                results[index] = {
+                    'course_name': course['name'],
+                    'course_ref_id': course['refId'],
+                    'emails': emails
+                }
+            except Exception as e:
+                print(f"Error scraping course {course['name']}: {str(e)}")
+                FAILURES.inc(phase='course')
+            if job:
+                job.course_scraped(results[index])
+
+    extra_pages = []
+    try:
+        for _ in range(min(concurrency, len(courses)) - 1):
+            extra_pages.append(await context.new_page())
+        await asyncio.gather(*(worker(page) for page in [first_page] + extra_pages))
+    finally:
+        for page in extra_pages:
+            await page.close()
+
+    return [result for result in results if result is not None]
+
+async def course_list(session_id, fetch_overview):
+    """Returns (courses, cached): the user's cached course list, or the one parsed
+    from the overview page that `fetch_overview()` returns."""
+    courses = await asyncio.to_thread(course_cache.load, session_id)
+    if courses is not None:
+        print(f"Using the cached course list ({len(courses)} courses)")
+        return courses, True
+    courses = await parse_pool.extract_courses(await fetch_overview())
     print('Extracted Courses:', courses)
+    await asyncio.to_thread(course_cache.save, session_id, courses)
+    return courses, False
+
+async def check_cached_courses(session_id, courses, results):
+    """Drops the cached course list if one of its membership pages failed.
+
+    Every course lists at least its administrator, so an empty roster means
+    ILIAS answered with an error page (e.g. the user left the course).
+    """
+    if len(results) < len(courses) or any(not result['emails'] for result in results):
+        print(f"Membership page error for a cached course of {session_id}, the course list will be reloaded")
+        await asyncio.to_thread(course_cache.invalidate, session_id)
+
+async def scrape_courses_over_http(session_id, job=None):
+    """Fetches the course overview and membership pages without the browser.
+
+    The session page is closed once the cookies are known to work, so nothing is
+    rendered while the rosters are fetched; with a cached course list the
+    overview is skipped. Raises SessionExpiredError if ILIAS rejects the
+    cookies at any point.
+    """
+    session = session_data[session_id]
+    http_session = await IliasHttpSession.from_context(session['context'])
+
+    async def fetch_overview():
+        html_content = await http_session.get(MAIN_COURSES_URL)
+        await session['page'].close()
+        return html_content
+
+    courses, cached = await course_list(session_id, fetch_overview)
+    if job:
+        job.start_scraping(len(courses))
+
+    semaphore = asyncio.Semaphore(max(1, config.SCRAPE_CONCURRENCY))
+
+    async def fetch(course):
+        async with semaphore:
+            try:
+                with COURSE_NAVIGATION_SECONDS.time(path='http'):
+                    emails = await fetch_roster_over_http(http_session, course)
+            except SessionExpiredError:
+                raise
+            except Exception as e:
+                print(f"Error scraping course {course['name']}: {str(e)}")
+                FAILURES.inc(phase='course')
+                if job:
+                    job.course_scraped(None)
+                return None
+        print(f"Email Column Data for {course['name']}:", emails)
+        result = {
+            'course_name': course['name'],
+            'course_ref_id': course['refId'],
+            'emails': emails
+        }
+        if job:
+            job.course_scraped(result)
+        return result
 
-    all_email_column_data = []
-    for course in courses:
+    tasks = [asyncio.create_task(fetch(course)) for course in courses]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        # Stop the other fetches before the browser takes over
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    results = [result for result in results if result is not None]
+    if cached:
+        await check_cached_courses(session_id, courses, results)
+    return results
+
+async def scrape_courses_in_browser(session_id, job=None):
+    """Scrapes the courses in the browser; those already in `job.results` are not scraped again."""
+    session = session_data[session_id]
+    if session['page'].is_closed():
+        session['page'] = await session['context'].new_page()
+
+    async def fetch_overview():
+        await navigate_to_main_courses_page(session["page"])
+        return await session["page"].content()
+
+    courses, cached = await course_list(session_id, fetch_overview)
+    scraped = {result['course_ref_id']: result for result in job.results} if job else {}
+    remaining = [course for course in courses if course['refId'] not in scraped]
+    if job:
+        job.start_scraping(len(courses), done=len(courses) - len(remaining))
+
+    results = await scrape_courses(session["context"], session["page"], remaining, job=job)
+    if scraped:
+        by_ref_id = dict(scraped, **{result['course_ref_id']: result for result in results})
+        results = [by_ref_id[course['refId']] for course in courses if course['refId'] in by_ref_id]
+    if cached:
+        await check_cached_courses(session_id, courses, results)
+    return results
+
+async def process_courses(session_id, job=None):
+    """Scrapes every course of the logged-in session and provisions the rosters.
+
+    Progress and partial results are reported on `job` when one is given.
+    """
+    all_email_column_data = None
+    if config.HTTP_FETCH:
         try:
-            course_html_content, emails = await visit_course_page_and_scrape(session_data[session_id]["page"], course)
-            all_email_column_data.append({
-                'course_name': course['name'],
-                'course_ref_id': course['refId'],
-                'emails': emails
-            })
-        except Exception as e:
-            print(f"Error scraping course {course['name']}: {str(e)}")
+            all_email_column_data = await scrape_courses_over_http(session_id, job)
+        except SessionExpiredError as e:
+            print(f"{str(e)}; falling back to the browser")
+    if all_email_column_data is None:
+        # Courses fetched before the session expired stay in job.results and are not scraped again
+        all_email_column_data = await scrape_courses_in_browser(session_id, job)
+
+    await cleanup_session(session_id, job.id if job else None)
+
+    response = {"status": "success", "data": all_email_column_data}
+    if job:
+        # Courses finish out of order when scraped concurrently
+        job.results = all_email_column_data
+    if config.MATRIX_PROVISIONING:
+        if job:
+            job.set_phase(jobs.PROVISIONING)
+        report = response["provisioning"] = await provision_rosters(all_email_column_data)
+        print(f"Matrix provisioning: {report['memberships']} memberships, {report['duplicates']} duplicate, "
+              f"{report['known']} already in their room; {report['calls_planned']} calls planned, "
+              f"{report['calls_executed']} executed")
+        if job:
+            job.provisioning = report
+    return response
 
-    await cleanup_session(session_id)
-    return JSONResponse({"status": "success", "data": all_email_column_data})
+async def provision_rosters(all_email_column_data):
+    """Brings the Matrix rooms in line with the scraped rosters.
+
+    All courses are planned together: a membership scraped more than once is
+    sent once and memberships a course snapshot already records are dropped,
+    so with incremental sync only the members added to or removed from a
+    course since its last snapshot are sent, and courses whose roster hash is
+    unchanged are skipped. A member who left a course stays in its room while
+    another course of the same room still lists them. A snapshot only records
+    changes Matrix accepted, so failed memberships are retried on the next sync.
+    """
+    if not config.INCREMENTAL_SYNC:
+        return await matrix_client.provision(memberships_from_courses(all_email_column_data))
+
+    report = {"courses_unchanged": 0, "added": 0, "removed": 0}
+    changes = []
+    known = set()
+    listed = set()
+    for course in all_email_column_data:
+        members = normalize_roster(course['emails'])
+        listed.update((user_id_from_email(email), course['course_name']) for email in members)
+        snapshot = await asyncio.to_thread(snapshot_store.load, course['course_ref_id'])
+        unchanged, added, removed = diff_roster(snapshot, course['course_name'], members)
+        if snapshot is not None and snapshot.get("room_name") == course['course_name']:
+            known.update((user_id_from_email(email), course['course_name']) for email in snapshot["members"])
+        if unchanged:
+            report["courses_unchanged"] += 1
+            continue
+        if not config.MATRIX_REMOVE_MEMBERS:
+            removed = set()
+        changes.append((course, members, snapshot, added, removed))
+    # Rooms shared by several courses keep everyone one of them lists
+    changes = [(course, members, snapshot, added,
+                {email for email in removed if (user_id_from_email(email), course['course_name']) not in listed})
+               for course, members, snapshot, added, removed in changes]
+
+    additions = memberships_from_courses(course for course, members, snapshot, added, removed in changes)
+    removals = [(user_id_from_email(email), course['course_name'])
+                for course, members, snapshot, added, removed in changes for email in removed]
+    add_report, failed_additions = await matrix_client.add_memberships(additions, known)
+    remove_report, failed_removals = await matrix_client.remove_memberships(removals)
+    report.update(merge_reports(add_report, remove_report))
+
+    for course, members, snapshot, added, removed in changes:
+        room_name = course['course_name']
+        failed_added = {email for email in added if (user_id_from_email(email), room_name) in failed_additions}
+        failed_removed = {email for email in removed if (user_id_from_email(email), room_name) in failed_removals}
+        report["added"] += len(added) - len(failed_added)
+        report["removed"] += len(removed) - len(failed_removed)
+        await asyncio.to_thread(snapshot_store.save, course['course_ref_id'], room_name,
+                                (members - failed_added) | failed_removed)
+
+    return report
 
 @app.get("/screenshot")
-async def get_screenshot(session_id: str = Query(...)):
-    """Retrieve the latest screenshot for the given session ID."""
-    if session_id not in session_data or 'screenshot' not in session_data[session_id]:
+async def get_screenshot(request: Request, session_id: str = Query(...)):
+    """Retrieve the latest screenshot for the given session ID.
+
+    Polling keeps frames coming for a few seconds; the first request of a
+    session may find none yet. Answers 304 when the client already has the
+    current frame (If-None-Match).
+    """
+    if session_id in session_data:
+        session_data[session_id]['screenshot_polled'] = time.monotonic()
+        capture_screenshot(session_id)
+    if session_id not in session_data or not session_data[session_id].get('screenshot'):
         raise HTTPException(status_code=404, detail="Screenshot not found for the provided session ID")
 
+    etag = f'"{session_data[session_id]["screenshot_etag"]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
     screenshot_data = session_data[session_id]['screenshot']
     # Encode screenshot to base64 for returning as JSON
     screenshot_base64 = base64.b64encode(screenshot_data).decode('utf-8')
-    return JSONResponse({"screenshot": f"data:image/png;base64,{screenshot_base64}"})
-
+    return JSONResponse({"screenshot": f"data:{SCREENSHOT_TYPE};base64,{screenshot_base64}"}, headers=headers)
+
+@app.websocket("/ws/screenshot")
+async def stream_screenshots(websocket: WebSocket, session_id: str = Query(...)):
+    """Pushes each new screenshot of the session as a binary frame.
+
+    The first message is text naming the image type. Frames are only taken
+    while at least one client is connected. The socket is read alongside, so
+    a client that closes or drops ends the handler at once rather than at
+    the next frame.
+    """
+    await websocket.accept()
+    watched = session_data.get(session_id)
+    if watched is not None:
+        watched['screenshot_watchers'] += 1
+        capture_screenshot(session_id)
+
+    def unwatch():
+        nonlocal watched
+        if watched is not None:
+            watched['screenshot_watchers'] -= 1
+            # Lets the capture loop notice that nobody watches any more
+            watched['screenshot_wanted'].set()
+            watched = None
+
+    async def push_frames():
+        sent_etag = None
+        await websocket.send_text(json.dumps({"type": SCREENSHOT_TYPE}))
+        while session_id in session_data:
+            session = session_data[session_id]
+            if session['screenshot_etag'] and session['screenshot_etag'] != sent_etag:
+                sent_etag = session['screenshot_etag']
+                await websocket.send_bytes(session['screenshot'])
+            async with session['screenshot_changed']:
+                try:
+                    await asyncio.wait_for(
+                        session['screenshot_changed'].wait_for(
+                            lambda: session.get('closed') or session['screenshot_etag'] != sent_etag),
+                        timeout=config.SCREENSHOT_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    pass
+            if session.get('closed'):
+                break
+        await websocket.close()
+
+    async def wait_for_disconnect():
+        # Clients send nothing; this only returns once they go away
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+        unwatch()
+
+    tasks = [asyncio.create_task(push_frames()), asyncio.create_task(wait_for_disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, WebSocketDisconnect):
+                print(f"Screenshot stream for {session_id} failed: {str(result)}")
+        unwatch()
+
+
+async def expire_session(session_id):
+    """Ends an idle or evicted session together with the job waiting on it."""
+    session = session_data.get(session_id)
+    if session and session.get('job_id'):
+        job_queue.cancel(session['job_id'], reason="Session expired")
+    await cleanup_session(session_id)
 
-async def cleanup_session(session_id):
-    if session_id in session_data:
-        await session_data[session_id]['page'].close()
-        await session_data[session_id]['browser'].close()
-        await session_data[session_id]['playwright'].stop()
-        del session_data[session_id]
+@app.get("/metrics")
+async def get_metrics():
+    """Phase latencies, failures and pool sizes in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/ready")
+async def readiness():
+    """200 once the parser processes and the login contexts are prewarmed, 503 until then."""
+    return JSONResponse({
+        "ready": ready.is_set(),
+        "prewarm_seconds": prewarm_seconds,
+        "prewarm": warm_contexts.stats(),
+    }, status_code=200 if ready.is_set() else 503)
+
+@app.get("/worker/capacity")
+async def worker_capacity():
+    """Load of this process; the gateway places new sessions on the worker with the most room."""
+    sessions = session_data.stats()
+    browsers = browser_pool.stats()
+    memory_error = browser_pool.memory_error()
+    return JSONResponse({
+        "worker": config.WORKER_ID,
+        "sessions": sessions["active"],
+        "busy": sessions["busy"],
+        "max_sessions": sessions["max_sessions"],
+        # No room for anyone while a new session would not fit in memory
+        "free": 0 if memory_error else sessions["max_sessions"] - sessions["busy"],
+        "browsers": browsers["connected"],
+        "contexts": browsers["contexts"],
+        "memory_mb": browsers["memory_mb"],
+        "memory_error": memory_error,
+        "jobs_queued": job_queue.queued(),
+        "ready": ready.is_set(),
+    })
+
+@app.get("/worker/sessions/{session_id}")
+async def worker_has_session(session_id: str):
+    return Response(status_code=204 if session_id in session_data else 404)
+
+@app.get("/sessions/stats")
+async def session_stats():
+    return JSONResponse({
+        "sessions": session_data.stats(),
+        "browsers": browser_pool.stats(),
+        "prewarm": warm_contexts.stats(),
+        "requests": scrape_profiles.totals,
+        "event_loop_lag": metrics.loop_lag,
+    })
+
+async def cleanup_session(session_id, job_id=None):
+    """Closes the session; with `job_id`, only if that job still owns it.
+
+    A newer sync of the same user replaces the session, and the older job
+    must not close the newer one's.
+    """
+    if session_id in session_data and (job_id is None or session_data[session_id].get('job_id') == job_id):
+        session = session_data.pop(session_id)
+        session['closed'] = True
+        if session['screenshot_task']:
+            session['screenshot_task'].cancel()
+        await notify_screenshot_watchers(session)
+        if session.get('routing'):
+            session['routing'].add_to_totals()
+            print(f"Session {session_id} requests: {session['routing'].stats()}")
+        try:
+            await session['page'].close()
+            await session['context'].close()
+        except Exception as e:
+            print(f"Error cleaning up session {session_id}: {str(e)}")
 
 #if __name__ == "__main__":
     #import uvicorn
@@ -0,0 +1,199 @@
+"""Static assets: content-hashed copies, precompressed variants and the service worker.
+
+    python assets.py
+
+copies every file of static/ and favicon_io/ to <UNISYNC_ASSET_BUILD_DIR>/assets
+under a name carrying its content hash (css/styles.3f9c0a1b2d4e.css), next
+to gzip and, with the brotli package installed, brotli variants. It also
+writes the map from source path to hashed URL and the service worker with
+its precache list. Files of earlier builds are kept, so pages rendered
+before a deploy still find their assets. Without a build the pages link the
+unhashed files and the service worker precaches those instead.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+import config
+
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+
+# URL prefix -> source directory
+SOURCE_DIRS = {"static": "static", "favicon_io": "favicon_io"}
+ASSETS_URL = "/assets"
+# Files the pages can use; anything else (e.g. favicon_io/about.txt) is not published
+ASSET_EXTENSIONS = {".css", ".js", ".json", ".webmanifest", ".png", ".ico", ".svg", ".woff2"}
+# Only worth compressing where it saves at least a tenth
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".json", ".webmanifest", ".ico", ".svg"}
+# Pages the service worker keeps for offline use: index.html and login.html
+PAGES = ["/", "/sync"]
+SERVICE_WORKER_TEMPLATE = "service-worker.js"
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_manifest = None
+
+
+def manifest_path(build_dir=None):
+    return os.path.join(build_dir or config.ASSET_BUILD_DIR, "asset-manifest.json")
+
+
+def service_worker_path(build_dir=None):
+    return os.path.join(build_dir or config.ASSET_BUILD_DIR, "service-worker.js")
+
+
+def source_files():
+    """Yields (source path, logical path) of every publishable asset, e.g. ("static/css/styles.css", same)."""
+    for prefix, directory in SOURCE_DIRS.items():
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                if os.path.splitext(name)[1] in ASSET_EXTENSIONS:
+                    source = os.path.join(root, name)
+                    yield source, prefix + "/" + os.path.relpath(source, directory).replace(os.sep, "/")
+
+
+def hashed_name(logical_path, content):
+    stem, extension = os.path.splitext(logical_path)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{extension}"
+
+
+def load_manifest():
+    """{logical path: hashed URL} of the latest build, empty if there is none."""
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(manifest_path(), encoding="utf-8") as manifest_file:
+                _manifest = json.load(manifest_file)
+        except FileNotFoundError:
+            _manifest = {}
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable asset manifest: {str(e)}")
+            _manifest = {}
+    return _manifest
+
+
+def asset_url(logical_path):
+    """URL of an asset for the templates: the content-hashed copy if built, else the source file."""
+    return load_manifest().get(logical_path, "/" + logical_path)
+
+
+def render_service_worker(urls):
+    """The service worker with its precache list; the cache name changes with the list."""
+    with open(SERVICE_WORKER_TEMPLATE, encoding="utf-8") as template_file:
+        template = template_file.read()
+    version = hashlib.sha256(json.dumps(urls).encode() + template.encode()).hexdigest()[:12]
+    return (template.replace("__VERSION__", version)
+            .replace("__PRECACHE_URLS__", json.dumps(urls, indent=4)))
+
+
+def precache_urls(manifest):
+    # Hashed URLs when built, the source files otherwise
+    urls = [manifest.get(logical_path, "/" + logical_path) for _, logical_path in source_files()]
+    return PAGES + urls
+
+
+def _compressors():
+    compressors = [(".gz", lambda data: gzip.compress(data, 9, mtime=0))]
+    try:
+        import brotli
+    except ImportError:
+        print("brotli is not installed, only gzip variants are written")
+    else:
+        compressors.append((".br", lambda data: brotli.compress(data, quality=11)))
+    return compressors
+
+
+def build(build_dir=None):
+    """Writes the hashed and compressed assets, the manifest and the service worker."""
+    build_dir = build_dir or config.ASSET_BUILD_DIR
+    compressors = _compressors()
+    manifest = {}
+    written = 0
+    for source, logical_path in source_files():
+        with open(source, "rb") as source_file:
+            content = source_file.read()
+        name = hashed_name(logical_path, content)
+        target = os.path.join(build_dir, "assets", *name.split("/"))
+        manifest[logical_path] = ASSETS_URL + "/" + name
+        if os.path.exists(target):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(source, target)
+        written += 1
+        if os.path.splitext(name)[1] in COMPRESSIBLE_EXTENSIONS:
+            for suffix, compress in compressors:
+                compressed = compress(content)
+                if len(compressed) <= 0.9 * len(content):
+                    with open(target + suffix, "wb") as compressed_file:
+                        compressed_file.write(compressed)
+
+    with open(manifest_path(build_dir), "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    with open(service_worker_path(build_dir), "w", encoding="utf-8") as service_worker_file:
+        service_worker_file.write(render_service_worker(precache_urls(manifest)))
+    print(f"{len(manifest)} assets ({written} new) and the service worker written to {build_dir}")
+    return manifest
+
+
+def service_worker_source():
+    """The built service worker, or one rendered for the unhashed source files."""
+    try:
+        with open(service_worker_path(), encoding="utf-8") as service_worker_file:
+            return service_worker_file.read()
+    except FileNotFoundError:
+        return render_service_worker(precache_urls({}))
+
+
+def accepted_encodings(header):
+    encodings = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+class AssetFiles(StaticFiles):
+    """StaticFiles that answers with a precompressed .br or .gz copy when the client takes it.
+
+    Files under content-hashed names never change, so with immutable=True
+    browsers keep them for a year without asking again. Everything else is
+    revalidated on every use (Cache-Control: no-cache) through its ETag.
+    """
+
+    def __init__(self, *args, immutable=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.immutable = immutable
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        media_type = mimetypes.guess_type(str(full_path))[0] or "application/octet-stream"
+        headers = {"Cache-Control": IMMUTABLE if self.immutable else "no-cache", "Vary": "Accept-Encoding"}
+        response = None
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding in accepted:
+                try:
+                    variant_stat = os.stat(str(full_path) + suffix)
+                except OSError:
+                    continue
+                response = FileResponse(str(full_path) + suffix, status_code=status_code, stat_result=variant_stat,
+                                        media_type=media_type, headers=dict(headers, **{"Content-Encoding": encoding}))
+                break
+        if response is None:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result,
+                                    media_type=media_type, headers=headers)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+if __name__ == "__main__":
+    build()
@@ -0,0 +1,122 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+
+import config
+from file_store import atomic_write, key_path
+
+SALT_BYTES = 16
+VERIFIER_BYTES = 32
+# scrypt cost: about 50 ms and 16 MB per derivation
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+
+class AuthStateCache:
+    """Encrypted per-user cache of the Playwright storage state after login.
+
+    Entries are Fernet tokens, so they are authenticated as well as encrypted
+    and carry their creation time; anything older than the TTL is rejected
+    when read. An entry only opens with the password it was saved with: it
+    starts with a salt and a scrypt verifier of the password, which is
+    checked before anything else, and its encryption key is derived from the
+    password and the configured key. The cache is disabled unless
+    UNISYNC_AUTH_CACHE is set, a key is configured and the cryptography
+    package is installed.
+    """
+
+    def __init__(self, directory=None, key=None, ttl=None, enabled=None):
+        self.directory = directory or config.AUTH_CACHE_DIR
+        self.ttl = config.AUTH_CACHE_TTL if ttl is None else ttl
+        key = key or config.AUTH_CACHE_KEY
+        enabled = config.AUTH_CACHE if enabled is None else enabled
+        self._key = None
+        self._fernet_class = None
+        self._invalid_token = None
+        if enabled:
+            # cryptography is only imported when the cache is turned on
+            try:
+                from cryptography.fernet import Fernet, InvalidToken
+            except ImportError:
+                print("Auth cache disabled: the cryptography package is not installed")
+                return
+            if not key:
+                print("Auth cache disabled: UNISYNC_AUTH_CACHE_KEY is not set")
+            else:
+                # Fails early on a malformed key
+                Fernet(key)
+                self._key = base64.urlsafe_b64decode(key)
+                self._fernet_class = Fernet
+                self._invalid_token = InvalidToken
+
+    @property
+    def enabled(self):
+        return self._key is not None
+
+    def _derive(self, password, salt):
+        """(verifier, Fernet) for `password` with `salt`."""
+        derived = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P,
+                                 maxmem=64 * 1024 * 1024, dklen=2 * VERIFIER_BYTES)
+        key = hmac.new(self._key, derived[VERIFIER_BYTES:], hashlib.sha256).digest()
+        return derived[:VERIFIER_BYTES], self._fernet_class(base64.urlsafe_b64encode(key))
+
+    def _open(self, user_key, password):
+        """(Fernet token, Fernet) of the entry if `password` is the one it was saved with, else None."""
+        try:
+            with open(self.path(user_key), "rb") as state_file:
+                entry = state_file.read()
+        except FileNotFoundError:
+            return None
+        salt, verifier = entry[:SALT_BYTES], entry[SALT_BYTES:SALT_BYTES + VERIFIER_BYTES]
+        if len(verifier) < VERIFIER_BYTES:
+            return None
+        expected, fernet = self._derive(password, salt)
+        if not hmac.compare_digest(verifier, expected):
+            return None
+        return entry[SALT_BYTES + VERIFIER_BYTES:], fernet
+
+    def path(self, user_key):
+        return key_path(self.directory, user_key, ".state")
+
+    def load(self, user_key, password):
+        """Returns the cached storage state, or None if missing, saved with another
+        password, expired or tampered with. Only the last two remove the entry."""
+        if not self.enabled:
+            return None
+        opened = self._open(user_key, password)
+        if opened is None:
+            return None
+        token, fernet = opened
+        try:
+            return json.loads(fernet.decrypt(token, ttl=int(self.ttl)))
+        except (self._invalid_token, ValueError):
+            self.invalidate(user_key)
+            return None
+
+    def credentials(self, password):
+        """What save() needs of the password, derived up front so the password need not be kept."""
+        salt = os.urandom(SALT_BYTES)
+        verifier, fernet = self._derive(password, salt)
+        return salt, verifier, fernet
+
+    def save(self, user_key, credentials, storage_state):
+        """Stores `storage_state` under the `credentials()` of the user's password."""
+        if not self.enabled:
+            return
+        salt, verifier, fernet = credentials
+        entry = salt + verifier + fernet.encrypt(json.dumps(storage_state).encode())
+        atomic_write(self.path(user_key), entry, dir_mode=0o700)
+
+    def forget(self, user_key, password):
+        """Removes the entry, but only if `password` is the one it was saved with."""
+        if self.enabled and self._open(user_key, password) is not None:
+            self.invalidate(user_key)
+
+    def invalidate(self, user_key):
+        try:
+            os.unlink(self.path(user_key))
+        except FileNotFoundError:
+            pass
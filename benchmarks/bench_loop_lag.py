@@ -0,0 +1,85 @@
+"""Measures event loop lag while course rosters are parsed, in the loop and in the parser pool.
+
+A probe task sleeps for a few milliseconds at a time and records how late it
+wakes up, standing in for the screenshot polls and OTP submissions of other
+sessions. Meanwhile members pages are parsed, several at once, either in the
+event loop (UNISYNC_PARSER_PROCESSES=0) or in the process pool.
+
+    python -m benchmarks.bench_loop_lag [--pages 40] [--members 2000] [--concurrency 4] [--processes 2]
+"""
+import argparse
+import asyncio
+import time
+
+import parse_pool
+from benchmarks.fixtures import course_members_html
+
+PROBE_INTERVAL = 0.005
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, -(-len(ordered) * q // 100) - 1)] if ordered else float('nan')
+
+
+async def probe(lags):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        try:
+            await asyncio.sleep(PROBE_INTERVAL)
+        finally:
+            # A sleep still pending at the end counts too: a fully blocked loop never wakes the probe
+            lags.append(max(0.0, loop.time() - start - PROBE_INTERVAL))
+
+
+async def parse_pages(pages, html_content, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def parse_one():
+        async with semaphore:
+            return await parse_pool.extract_email_column_from_table(html_content)
+
+    return await asyncio.gather(*(parse_one() for _ in range(pages)))
+
+
+async def measure(args, processes, html_content):
+    parse_pool.stop()
+    parse_pool.start(processes)
+    # Spawn and import in the pool processes before measuring
+    await parse_pages(processes * 2, html_content, processes or 1)
+
+    lags = []
+    probe_task = asyncio.create_task(probe(lags))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    results = await parse_pages(args.pages, html_content, args.concurrency)
+    elapsed = time.perf_counter() - start
+    probe_task.cancel()
+    await asyncio.gather(probe_task, return_exceptions=True)
+    parse_pool.stop()
+    assert all(len(emails) == args.members for emails in results)
+    return elapsed, lags
+
+
+async def run(args):
+    html_content = course_members_html(args.members)
+    print(f"{args.pages} pages of {args.members} members ({len(html_content) / 1024:.0f} KiB), "
+          f"{args.concurrency} at a time")
+    for name, processes in (("event loop", 0), (f"{args.processes} processes", args.processes)):
+        elapsed, lags = await measure(args, processes, html_content)
+        print(f"{name:<14} {args.pages / elapsed:7.1f} pages/s   loop lag p50 {percentile(lags, 50) * 1000:7.1f} ms"
+              f"  p99 {percentile(lags, 99) * 1000:7.1f} ms  max {max(lags) * 1000:7.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=40)
+    parser.add_argument('--members', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--processes', type=int, default=2)
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Measures Matrix provisioning throughput against the local stand-in service.
+
+Compares the old pattern of one request per (user, room) membership, sent one
+after another, with MatrixProvisioningClient, which batches all rooms of a user
+into one call and keeps several requests in flight.
+
+With --courses the memberships come from synthetic faculty rosters instead:
+students in several courses, rows listed twice and students under two
+addresses, and a share of memberships already known from earlier syncs. The
+planned rows then show how many calls the cross-course plan saves.
+
+    python -m benchmarks.bench_matrix [--users 500] [--rooms-per-user 4] [--latency 0.02]
+    python -m benchmarks.bench_matrix --courses 200 [--roster-size 80] [--known 0.5]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from benchmarks.matrix_standin import create_app
+from benchmarks.server import free_port, serve, shutdown
+from matrix_client import MatrixProvisioningClient, memberships_from_courses
+
+
+def synthetic_memberships(users, rooms_per_user, rooms=40, seed=0):
+    rng = random.Random(seed)
+    room_names = [f"Course {index}" for index in range(rooms)]
+    return [(f"s{user:06d}", room_name)
+            for user in range(users)
+            for room_name in rng.sample(room_names, rooms_per_user)]
+
+
+def synthetic_courses(courses, roster_size, users, duplicate_rate=0.05, alias_rate=0.05, seed=0):
+    """Scraped rosters like process_courses returns them, drawn from one pool of students."""
+    rng = random.Random(seed)
+    all_email_column_data = []
+    for index in range(courses):
+        emails = []
+        for user in rng.sample(range(users), min(roster_size, users)):
+            domain = 'hs-heilbronn.de' if rng.random() < alias_rate else 'stud.hs-heilbronn.de'
+            emails.append(f"s{user:06d}@{domain}")
+            if rng.random() < duplicate_rate:
+                emails.append(emails[-1].upper())
+        all_email_column_data.append({'course_name': f"Course {index}", 'course_ref_id': str(1000 + index),
+                                      'emails': emails})
+    return all_email_column_data
+
+
+async def provision_one_by_one(base_url, memberships):
+    async with httpx.AsyncClient() as client:
+        for user_id, room_name in memberships:
+            response = await client.post(base_url + "/add_user_to_rooms", json={
+                "user_id": "@" + user_id + ":unifyhn.de",
+                "rooms": [{"room_name": room_name}]
+            })
+            response.raise_for_status()
+    return len(memberships)
+
+
+async def provision_batched(base_url, memberships, max_in_flight, known=()):
+    client = MatrixProvisioningClient(base_url=base_url, max_in_flight=max_in_flight)
+    try:
+        report = await client.provision(memberships, known)
+    finally:
+        await client.close()
+    print(f"  {report['memberships']} memberships, {report['duplicates']} duplicate, {report['known']} known: "
+          f"{report['calls_planned']} calls planned, {report['calls_executed']} executed")
+    return report["provisioned"]
+
+
+def scenarios(args):
+    if not args.courses:
+        memberships = synthetic_memberships(args.users, args.rooms_per_user)
+        return [
+            ("one request per membership", lambda url: provision_one_by_one(url, memberships)),
+            (f"batched, {args.max_in_flight} in flight",
+             lambda url: provision_batched(url, memberships, args.max_in_flight)),
+        ]
+    memberships = list(memberships_from_courses(synthetic_courses(args.courses, args.roster_size, args.users)))
+    distinct = list(dict.fromkeys(memberships))
+    known = set(random.Random(1).sample(distinct, int(len(distinct) * args.known)))
+    return [
+        ("one request per membership", lambda url: provision_one_by_one(url, memberships)),
+        ("planned", lambda url: provision_batched(url, memberships, args.max_in_flight)),
+        (f"planned, {args.known:.0%} known", lambda url: provision_batched(url, memberships, args.max_in_flight, known)),
+    ]
+
+
+async def run(args):
+    for name, provision in scenarios(args):
+        app = create_app(latency=args.latency)
+        port = free_port()
+        server, task = await serve(app, port)
+        try:
+            start = time.perf_counter()
+            provisioned = await provision(f"http://127.0.0.1:{port}")
+            elapsed = time.perf_counter() - start
+        finally:
+            await shutdown(server, task)
+        print(f"{name:<32} {provisioned:>6} memberships  {app.state.calls:>6} calls  "
+              f"{elapsed:>7.2f} s  {provisioned / elapsed:>9.1f} memberships/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--rooms-per-user', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.02, help='stand-in latency per request in seconds')
+    parser.add_argument('--max-in-flight', type=int, default=8)
+    parser.add_argument('--courses', type=int, default=0, help='plan from this many synthetic course rosters')
+    parser.add_argument('--roster-size', type=int, default=80)
+    parser.add_argument('--known', type=float, default=0.5, help='share of memberships that already exist')
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == '__main__':
+    main()
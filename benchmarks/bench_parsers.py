@@ -0,0 +1,96 @@
+"""Compares the HTML extraction backends on the saved ILIAS fixture pages.
+
+For every fixture the backends must produce exactly the same output; the
+benchmark then reports throughput and the peak memory of a single parse.
+Peak memory is measured as the growth of the peak RSS in a fresh process,
+because lxml allocates outside the Python heap where tracemalloc cannot see it.
+
+    python -m benchmarks.bench_parsers [--repeat 20]
+"""
+import argparse
+import multiprocessing
+import resource
+import sys
+import time
+
+import extraction
+from benchmarks.fixtures import SAVED_FIXTURES, load_fixture
+
+
+def _extractor(fixture_name, backend):
+    courses, emails = extraction.BACKENDS[backend]
+    return courses if fixture_name.startswith('membership_overview') else emails
+
+
+def _peak_rss():
+    # ru_maxrss survives exec on Linux, so a spawned child would report the
+    # parent's peak; VmHWM belongs to the child's own address space.
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _peak_rss_kib(fixture_name, backend, queue):
+    html_content = load_fixture(fixture_name)
+    extract = _extractor(fixture_name, backend)
+    before = _peak_rss()
+    extract(html_content)
+    queue.put(_peak_rss() - before)
+
+
+def measure_peak_rss(fixture_name, backend):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_peak_rss_kib, args=(fixture_name, backend, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def measure_throughput(extract, html_content, repeat):
+    extract(html_content)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        extract(html_content)
+    elapsed = time.perf_counter() - start
+    return repeat / elapsed, elapsed / repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20, help='parses per fixture and backend')
+    args = parser.parse_args(argv)
+
+    backends = sorted(extraction.BACKENDS)
+    mismatches = 0
+    print(f"{'fixture':<28}{'backend':<8}{'items':>7}{'pages/s':>10}{'ms/page':>10}{'peak RSS KiB':>14}")
+    for fixture_name in SAVED_FIXTURES:
+        html_content = load_fixture(fixture_name)
+        outputs = {}
+        for backend in backends:
+            extract = _extractor(fixture_name, backend)
+            outputs[backend] = extract(html_content)
+            pages_per_second, seconds_per_page = measure_throughput(extract, html_content, args.repeat)
+            peak_rss = measure_peak_rss(fixture_name, backend)
+            print(f"{fixture_name:<28}{backend:<8}{len(outputs[backend]):>7}"
+                  f"{pages_per_second:>10.1f}{seconds_per_page * 1000:>10.2f}{peak_rss:>14}")
+        reference = outputs[backends[0]]
+        for backend in backends[1:]:
+            if outputs[backend] != reference:
+                mismatches += 1
+                print(f"MISMATCH: {backend} differs from {backends[0]} on {fixture_name}")
+
+    if mismatches:
+        return 1
+    print("All backends produced identical output.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""Measures the size and encode time of the job results, plain against compact.
+
+Builds department-wide results from synthetic rosters (students in several
+courses) and encodes them as GET /jobs/{id} would: the plain format through
+json.dumps as JSONResponse did before, and both formats through
+roster_payload.dumps (orjson when installed), each uncompressed, gzipped and
+brotli-compressed. Times include building the compact form.
+
+    python -m benchmarks.bench_payload [--courses 400] [--roster-size 120] [--users 6000]
+"""
+import argparse
+import gzip
+import json
+import time
+
+import roster_payload
+from benchmarks.bench_matrix import synthetic_courses
+
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def encodings():
+    yield "identity", lambda body: body
+    yield "gzip", lambda body: gzip.compress(body, roster_payload.GZIP_LEVEL)
+    if roster_payload.brotli is not None:
+        yield "br", lambda body: roster_payload.brotli.compress(body, quality=roster_payload.BROTLI_QUALITY)
+
+
+def run(args):
+    courses = synthetic_courses(args.courses, args.roster_size, args.users, duplicate_rate=0, alias_rate=0)
+    emails = sum(len(course['emails']) for course in courses)
+    compact = roster_payload.compact_courses(courses)
+    assert roster_payload.expand_courses(compact) == courses
+    print(f"{len(courses)} courses, {emails} roster rows, {len(compact['members'])} unique members; "
+          f"encoder {'orjson' if roster_payload.orjson else 'json'}")
+
+    formats = [
+        ("plain json.dumps", lambda: json.dumps({"data": courses}).encode("utf-8")),
+        ("plain", lambda: roster_payload.dumps({"data": courses})),
+        ("compact", lambda: roster_payload.dumps({"data": roster_payload.compact_courses(courses)})),
+    ]
+    baseline = None
+    for name, encode in formats:
+        encode_seconds, body = best_time(encode, args.repeat)
+        for encoding, compress in encodings():
+            compress_seconds, compressed = best_time(lambda: compress(body), args.repeat)
+            baseline = baseline or len(compressed)
+            print(f"{name:17} {encoding:9} {len(compressed) / 1024:9.1f} KiB  {len(compressed) / baseline:6.1%}  "
+                  f"{(encode_seconds + compress_seconds) * 1000:8.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=400)
+    parser.add_argument('--roster-size', type=int, default=120)
+    parser.add_argument('--users', type=int, default=6000, help='students the rosters are drawn from')
+    parser.add_argument('--repeat', type=int, default=5)
+    run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
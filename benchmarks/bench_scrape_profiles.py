@@ -0,0 +1,76 @@
+"""Measures per-course navigation time with and without the "scrape" profile.
+
+Starts the ILIAS stand-in, then loads course member pages in Chromium once
+with every request allowed and once routed through the scrape profile, and
+reports the mean navigation time, requests made and bytes transferred.
+Needs a Playwright Chromium (``playwright install chromium``).
+
+    python -m benchmarks.bench_scrape_profiles [--courses 15] [--asset-latency 0.03]
+"""
+import argparse
+import asyncio
+import time
+
+from playwright.async_api import async_playwright
+
+from benchmarks.ilias_standin import create_app
+from benchmarks.server import free_port, serve, shutdown
+from scrape_profiles import install_scrape_profiles
+
+
+async def load_courses(browser, base_url, courses, profile):
+    context = await browser.new_context()
+    routing = await install_scrape_profiles(context, profile) if profile else None
+    transferred = {'requests': 0, 'bytes': 0}
+
+    def count(response):
+        transferred['requests'] += 1
+        transferred['bytes'] += int(response.headers.get('content-length', 0) or 0)
+
+    context.on('response', count)
+    page = await context.new_page()
+    timings = []
+    for ref_id in range(100000, 100000 + courses):
+        url = f"{base_url}/ilias.php?baseClass=ilrepositorygui&cmdClass=ilCourseMembershipGUI&ref_id={ref_id}"
+        start = time.perf_counter()
+        await page.goto(url)
+        await page.content()
+        timings.append(time.perf_counter() - start)
+    await context.close()
+    return sum(timings) / len(timings), transferred, routing.stats() if routing else None
+
+
+async def run(args):
+    app = create_app(latency=args.latency, asset_latency=args.asset_latency, roster_size=args.roster_size,
+                     require_login=False)
+    port = free_port()
+    server, task = await serve(app, port)
+    playwright = await async_playwright().start()
+    browser = await playwright.chromium.launch()
+    try:
+        results = {}
+        for profile in (None, 'scrape'):
+            results[profile] = await load_courses(browser, f"http://127.0.0.1:{port}", args.courses, profile)
+            mean, transferred, stats = results[profile]
+            print(f"{profile or 'no interception':<16} {mean * 1000:>8.1f} ms/course  "
+                  f"{transferred['requests']:>5} responses  {transferred['bytes'] / 1024:>9.0f} KiB"
+                  + (f"  blocked {stats['requests_blocked']} requests" if stats else ""))
+        baseline, scrape = results[None][0], results['scrape'][0]
+        print(f"Per-course navigation time reduced by {(1 - scrape / baseline) * 100:.0f}%")
+    finally:
+        await browser.close()
+        await playwright.stop()
+        await shutdown(server, task)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=15)
+    parser.add_argument('--roster-size', type=int, default=60)
+    parser.add_argument('--latency', type=float, default=0.05, help='document latency in seconds')
+    parser.add_argument('--asset-latency', type=float, default=0.03, help='latency per asset in seconds')
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == '__main__':
+    main()
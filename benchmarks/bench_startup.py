@@ -0,0 +1,108 @@
+"""Measures cold start: import time, time to serve, time to /ready and the first login.
+
+Imports the app in a fresh interpreter, then starts it under uvicorn against
+the ILIAS/Keycloak stand-in with and without prewarmed login contexts
+(UNISYNC_PREWARM_CONTEXTS) and reports when it first answers, when /ready
+turns 200 and how long the first login up to the OTP prompt takes. Needs a
+Playwright Chromium.
+
+    python -m benchmarks.bench_startup [--prewarm 2] [--login-latency 0.2]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.ilias_standin import create_app
+from benchmarks.loadtest import PASSWORD, OTP, wait_for_phase
+from benchmarks.server import free_port, serve, shutdown
+
+
+def import_seconds(module, repeat=3):
+    """Best wall time of importing `module` in a fresh interpreter, minus the interpreter's own start."""
+    def best(code):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], check=True)
+            times.append(time.perf_counter() - start)
+        return min(times)
+    return best(f'import {module}') - best('pass')
+
+
+async def wait_for(client, path, status, start, timeout=120.0):
+    while time.perf_counter() - start < timeout:
+        try:
+            if (await client.get(path)).status_code == status:
+                return time.perf_counter() - start
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.02)
+    raise TimeoutError(f"{path} did not answer {status} within {timeout} s")
+
+
+async def cold_start(standin_port, prewarm, state_dir):
+    port = free_port()
+    env = dict(os.environ, **{
+        'UNISYNC_ILIAS_BASE_URL': f'http://127.0.0.1:{standin_port}',
+        'UNISYNC_LOGIN_BASE_URL': f'http://localhost:{standin_port}',
+        'UNISYNC_PREWARM_CONTEXTS': str(prewarm),
+        'UNISYNC_SNAPSHOT_DIR': os.path.join(state_dir, 'snapshots'),
+        'UNISYNC_COURSE_CACHE_DIR': os.path.join(state_dir, 'courses'),
+        'UNISYNC_AUTH_CACHE': '0',
+    })
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app:app', '--host', '127.0.0.1',
+                                '--port', str(port), '--log-level', 'warning'], env=env, stdout=subprocess.DEVNULL)
+    try:
+        async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', timeout=60) as client:
+            serving = await wait_for(client, '/', 200, start)
+            ready = await wait_for(client, '/ready', 200, start)
+            login_start = time.perf_counter()
+            response = await client.post('/perform-sync', json={'username': 'startup', 'password': PASSWORD})
+            job = await wait_for_phase(client, response.json()['job_id'], {'otp_wait'}, 60)
+            if job['status'] != 'otp_wait':
+                raise RuntimeError(f"First login failed: {job.get('message', job['status'])}")
+            first_login = time.perf_counter() - login_start
+            await client.get('/submit-otp', params={'otp': OTP, 'session_id': response.json()['session_id']})
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return serving, ready, first_login
+
+
+async def run(args):
+    print(f"import app       {import_seconds('app') * 1000:8.0f} ms")
+    standin = create_app(latency=args.latency, login_latency=args.login_latency, asset_latency=args.asset_latency,
+                         password=PASSWORD, otp=OTP)
+    standin_port = free_port()
+    server, task = await serve(standin, standin_port)
+    try:
+        for prewarm in (0, args.prewarm):
+            with tempfile.TemporaryDirectory() as state_dir:
+                serving, ready, first_login = await cold_start(standin_port, prewarm, state_dir)
+            print(f"prewarm {prewarm}:  serving after {serving:6.2f} s  ready after {ready:6.2f} s  "
+                  f"first login {first_login:6.2f} s")
+    finally:
+        await shutdown(server, task)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--prewarm', type=int, default=2, help='prewarmed contexts to compare against none')
+    parser.add_argument('--latency', type=float, default=0.05, help='ILIAS page latency in seconds')
+    parser.add_argument('--login-latency', type=float, default=0.2, help='latency per Keycloak step in seconds')
+    parser.add_argument('--asset-latency', type=float, default=0.03, help='latency per asset in seconds')
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""Synthetic ILIAS pages shaped like the real membership overview and course member tables.
+
+Run ``python -m benchmarks.fixtures`` from the repository root to regenerate the
+saved fixture pages in ``benchmarks/fixtures/``.
+"""
+import os
+import random
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+_PAGE_HEAD = '''<!DOCTYPE html>
+<html lang="de" dir="ltr">
+<head>
+<meta charset="utf-8" />
+<title>{title} - ILIAS Hochschule Heilbronn</title>
+<link rel="stylesheet" type="text/css" href="./templates/default/delos.css?vers=8-12" />
+<script src="./node_modules/jquery/dist/jquery.js?vers=8-12"></script>
+<script src="./Services/JavaScript/js/Basic.js?vers=8-12"></script>
+</head>
+<body>
+<div id="ilAll">
+<header class="il-maincontrols-metabar">
+<ul class="il-maincontrols-metabar">
+<li><button class="btn btn-bulky" data-action="">Suche</button></li>
+<li><button class="btn btn-bulky" data-action="">Hilfe</button></li>
+<li><button class="btn btn-bulky" data-action="">Benachrichtigungen</button></li>
+<li><button class="btn btn-bulky" data-action="">Benutzer</button></li>
+</ul>
+</header>
+<nav class="il-maincontrols-mainbar" aria-label="Hauptleiste">
+{menu}
+</nav>
+<main class="il-layout-page-content">
+<div id="mainspacekeeper">
+<h1 class="ilHeader media-heading">{title}</h1>
+'''
+
+_PAGE_FOOT = '''</div>
+</main>
+<footer class="il-maincontrols-footer"><div class="il-footer-links"><ul>
+<li><a href="./ilias.php?baseClass=ilImprintGUI">Impressum</a></li>
+<li><a href="./ilias.php?baseClass=ilLegalNoticeGUI">Datenschutz</a></li>
+</ul></div></footer>
+</div>
+<script>il.Util.addOnLoad(function() {{ il.UI.maincontrols.mainbar.init(); }});</script>
+</body>
+</html>
+'''
+
+_MENU_ITEM = ('<div class="il-mainbar-entry"><button class="btn btn-bulky" id="mm_{index}">'
+              '<img class="icon custom small" src="./templates/default/images/outlined/icon_{index}.svg" alt="" />'
+              '<span class="bulky-label">Eintrag {index}</span></button></div>')
+
+_COURSE_ROW = '''<div class="il-std-item-container"><div class="il-std-item ">
+<div class="row">
+<div class="col-xs-2 col-sm-1"><img src="./templates/default/images/standard/icon_{kind}.svg" class="icon medium" alt="{alt}" /></div>
+<div class="col-xs-10 col-sm-11">
+<div class="il-item-title"><a href="https://ilias.hs-heilbronn.de/ilias.php?baseClass=ilrepositorygui&amp;ref_id={ref_id}">{name}</a></div>
+<div class="il-item-description">Wintersemester 2024/25</div>
+<div class="dropdown"><button class="btn btn-default dropdown-toggle" type="button" aria-label="Aktionen"><span class="caret"></span></button>
+<ul class="dropdown-menu"><li><button class="btn btn-link" data-action="">Abmelden</button></li></ul></div>
+</div>
+</div>
+</div></div>
+'''
+
+_MEMBERS_HEAD = '''<form class="form-inline" method="post" action="ilias.php?ref_id={ref_id}&amp;cmd=post&amp;cmdClass=ilcoursemembershipgui">
+<div class="ilTableOuter">
+<table class="table table-striped fullwidth" id="crs_members_{ref_id}">
+<thead><tr>
+<th class="ilTableSelectAll"><input type="checkbox" name="select_cmd_all" /></th>
+<th><a href="#">Name</a></th><th><a href="#">Benutzername</a></th><th><a href="#">Rolle</a></th>
+<th><a href="#">E-Mail</a></th><th>Aktionen</th>
+</tr></thead>
+<tbody>
+'''
+
+_MEMBER_ROW = ('<tr class="{parity}"><td><input type="checkbox" name="participants[]" value="{user_id}" /></td>'
+               '<td class="std">{last}, {first}</td><td class="std">{login}</td><td class="std">Kursmitglied</td>'
+               '<td class="std">\n {login}@stud.hs-heilbronn.de\n</td><td class="std"><a href="#">Bearbeiten</a></td></tr>\n')
+
+_MEMBERS_FOOT = '''</tbody>
+</table>
+</div>
+</form>
+'''
+
+_FIRST_NAMES = ['Anna', 'Ben', 'Clara', 'David', 'Elif', 'Finn', 'Greta', 'Hannes', 'Ida', 'Jonas', 'Lea', 'Mehmet']
+_LAST_NAMES = ['Müller', 'Schmidt', 'Schneider', 'Fischer', 'Weber', 'Meyer', 'Wagner', 'Becker', 'Yılmaz', 'Hoffmann']
+
+
+def _page(title, body, menu_items=40):
+    menu = '\n'.join(_MENU_ITEM.format(index=index) for index in range(menu_items))
+    return _PAGE_HEAD.format(title=title, menu=menu) + body + _PAGE_FOOT.format()
+
+
+def membership_overview_html(n_courses=15, n_groups=5, seed=0):
+    rng = random.Random(seed)
+    kinds = ['crs'] * n_courses + ['grp'] * n_groups
+    rng.shuffle(kinds)
+    rows = []
+    for index, kind in enumerate(kinds):
+        rows.append(_COURSE_ROW.format(
+            kind=kind,
+            alt='Symbol Gruppe' if kind == 'grp' else 'Symbol Kurs',
+            ref_id=rng.randint(100000, 999999),
+            name=f"{'Übungsgruppe' if kind == 'grp' else 'Vorlesung'} {index + 1} &amp; Praktikum",
+        ))
+    return _page('Kurse und Gruppen', '<div class="il-std-item-container-list">\n' + ''.join(rows) + '</div>\n')
+
+
+def _table_nav(ref_id, n_members, offset, page_size):
+    links = []
+    for page_offset in range(0, n_members, page_size):
+        label = page_offset // page_size + 1
+        if page_offset == offset:
+            links.append(f'<span class="ilTableNavActive">{label}</span>')
+        else:
+            links.append(f'<a href="ilias.php?baseClass=ilrepositorygui&amp;cmdClass=ilCourseMembershipGUI'
+                         f'&amp;ref_id={ref_id}&amp;crs_{ref_id}_table_nav=name:asc:{page_offset}">{label}</a>')
+    return '<div class="ilTableNav">' + ' '.join(links) + '</div>\n'
+
+
+def course_members(n_members, seed=0):
+    """(first name, last name, login) of every member of a synthetic course."""
+    rng = random.Random(seed)
+    return [(rng.choice(_FIRST_NAMES), rng.choice(_LAST_NAMES), f"s{rng.randint(0, 9)}{index:06d}")
+            for index in range(n_members)]
+
+
+def course_members_html(n_members, ref_id=123456, seed=0, offset=0, page_size=None):
+    """Members page for a course; with `page_size` only one page of the table is rendered."""
+    rows = []
+    for index, (first, last, login) in enumerate(course_members(n_members, seed)):
+        rows.append(_MEMBER_ROW.format(
+            parity='tblrow1' if index % 2 else 'tblrow2',
+            user_id=100000 + index,
+            first=first,
+            last=last,
+            login=login,
+        ))
+    nav = ''
+    if page_size and n_members > page_size:
+        rows = rows[offset:offset + page_size]
+        nav = _table_nav(ref_id, n_members, offset, page_size)
+    body = nav + _MEMBERS_HEAD.format(ref_id=ref_id) + ''.join(rows) + _MEMBERS_FOOT + nav
+    return _page('Mitglieder', body)
+
+
+def member_export_csv(n_members, seed=0):
+    """The members of `course_members_html` as ILIAS' member export CSV."""
+    lines = ['Nachname;Vorname;Benutzername;E-Mail']
+    for first, last, login in course_members(n_members, seed):
+        lines.append(f'{last};{first};{login};{login}@stud.hs-heilbronn.de')
+    return '\n'.join(lines) + '\n'
+
+
+def dashboard_html():
+    return _page('Dashboard', '<div class="il-deck"><p>Willkommen auf dem Dashboard.</p></div>\n')
+
+
+SAVED_FIXTURES = {
+    'membership_overview.html': lambda: membership_overview_html(n_courses=18, n_groups=6),
+    'course_members_30.html': lambda: course_members_html(30),
+    'course_members_250.html': lambda: course_members_html(250),
+    'course_members_2000.html': lambda: course_members_html(2000),
+}
+
+
+def fixture_path(name):
+    return os.path.join(FIXTURES_DIR, name)
+
+
+def load_fixture(name):
+    with open(fixture_path(name), encoding='utf-8') as fixture_file:
+        return fixture_file.read()
+
+
+def write_fixtures():
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for name, build in SAVED_FIXTURES.items():
+        with open(fixture_path(name), 'w', encoding='utf-8') as fixture_file:
+            fixture_file.write(build())
+        print(f"Wrote {fixture_path(name)}")
+
+
+if __name__ == '__main__':
+    write_fixtures()
@@ -0,0 +1,261 @@
+"""Local stand-in for ILIAS and its Keycloak login.
+
+Reproduces everything a sync visits: the Keycloak login form, the "try
+another way" choice and the OTP form, the form_post back to ILIAS and the
+dashboard redirect, then the membership overview, the course member tables
+(paginated) and the member export, built from ``benchmarks.fixtures``. Pages
+pull in the assets a real ILIAS page loads (stylesheets, scripts, icons, web
+fonts and an analytics script). Latencies and roster sizes are configurable.
+Any username is accepted with the password ``STANDIN_PASSWORD`` (default
+"secret") and the OTP ``STANDIN_OTP`` (default "123456"). Run it on its own with
+
+    uvicorn benchmarks.ilias_standin:app --port 8009
+
+and start the app with UNISYNC_ILIAS_BASE_URL and UNISYNC_LOGIN_BASE_URL
+pointing at it.
+"""
+import asyncio
+import html
+import os
+import secrets
+from urllib.parse import parse_qsl, urlencode
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
+
+from benchmarks.fixtures import course_members_html, dashboard_html, member_export_csv, membership_overview_html
+
+DASHBOARD_PATH = '/ilias.php?baseClass=ilDashboardGUI&cmd=jumpToSelectedItems'
+
+_KEYCLOAK_PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8" /><title>Sign in to hhn</title>
+<link rel="stylesheet" type="text/css" href="/resources/keycloak/login.css" /></head>
+<body class="login-pf">
+<div id="kc-header">Hochschule Heilbronn</div>
+<div id="kc-content">
+{error}{content}
+</div>
+</body>
+</html>
+"""
+
+_ERROR_BANNER = ('<div class="alert-error pf-c-alert pf-m-danger">'
+                 '<span id="input-error" class="kc-feedback-text">{message}</span></div>\n')
+
+_LOGIN_FORM = """<form id="kc-form-login" action="{action}" method="post">
+<input id="username" name="username" type="text" value="{username}" autofocus />
+<input id="password" name="password" type="password" />
+<input class="pf-c-button pf-m-primary" name="login" id="kc-login" type="submit" value="Sign In" />
+</form>
+"""
+
+_SECURITY_KEY_FORM = """<h1 id="kc-page-title">Security Key login</h1>
+<form id="kc-select-try-another-way-form" action="{action}" method="post">
+<input type="hidden" name="tryAnotherWay" value="on" />
+</form>
+<div id="kc-info"><a id="try-another-way" href="javascript:document.forms['kc-select-try-another-way-form'].submit()">Try Another Way</a></div>
+"""
+
+_SELECT_AUTHENTICATOR_FORM = """<h1 id="kc-page-title">Select login method</h1>
+<form id="kc-select-credential-form" action="{action}" method="post">
+<button class="select-auth-box" type="submit" name="authenticationExecution" value="webauthn">
+<div class="select-auth-box-headline">Security Key</div>
+<div class="select-auth-box-desc">Use your security key to sign in.</div></button>
+<button class="select-auth-box" type="submit" name="authenticationExecution" value="otp">
+<div class="select-auth-box-headline">Authenticator Application</div>
+<div class="select-auth-box-desc">Enter a verification code from authenticator application.</div></button>
+</form>
+"""
+
+_OTP_FORM = """<form id="kc-otp-login-form" action="{action}" method="post">
+<label for="otp">One-time code</label>
+<input id="otp" name="otp" autocomplete="off" type="text" autofocus />
+<input class="pf-c-button pf-m-primary" name="login" id="kc-login" type="submit" value="Sign In" />
+</form>
+"""
+
+_FORM_POST = """<!DOCTYPE html>
+<html><head><title>Submit This Form</title></head>
+<body onload="javascript:document.forms[0].submit()">
+<form method="post" action="{redirect_uri}">
+<input type="hidden" name="state" value="{state}" />
+<input type="hidden" name="id_token" value="{id_token}" />
+<noscript><button type="submit">Continue</button></noscript>
+</form>
+</body></html>
+"""
+
+_ASSET_TAGS = '''<link rel="stylesheet" type="text/css" href="/templates/default/delos.css" />
+<link rel="preload" as="font" type="font/woff2" href="/fonts/OpenSans-Regular.woff2" crossorigin />
+<link rel="preload" as="font" type="font/woff2" href="/fonts/OpenSans-Bold.woff2" crossorigin />
+<script src="/node_modules/jquery/dist/jquery.js"></script>
+<script src="/Services/JavaScript/js/Basic.js"></script>
+<script async src="/tracker/matomo.js"></script>
+</head>'''
+
+_BANNER_IMAGES = ''.join(f'<img src="/templates/default/images/banner_{index}.svg" alt="" />' for index in range(12))
+
+_CONTENT_TYPES = {
+    '.css': 'text/css',
+    '.js': 'application/javascript',
+    '.svg': 'image/svg+xml',
+    '.woff2': 'font/woff2',
+}
+
+_ASSET_SIZES = {
+    '.css': 350_000,
+    '.js': 120_000,
+    '.svg': 3_000,
+    '.woff2': 60_000,
+}
+
+
+def _authenticate_action(session_code):
+    return "/realms/hhn/login-actions/authenticate?" + urlencode({"session_code": session_code})
+
+
+def _with_assets(html_content):
+    html_content = html_content.replace('</head>', _ASSET_TAGS, 1)
+    return html_content.replace('<main class="il-layout-page-content">',
+                                '<main class="il-layout-page-content">' + _BANNER_IMAGES, 1)
+
+
+def _keycloak_page(content, error=None):
+    banner = _ERROR_BANNER.format(message=html.escape(error)) if error else ''
+    return HTMLResponse(_KEYCLOAK_PAGE.format(error=banner, content=content))
+
+
+def create_app(latency=None, asset_latency=None, roster_size=None, courses=None, page_size=None,
+               login_latency=None, password=None, otp=None, require_login=None):
+    """Builds the stand-in.
+
+    `latency` applies to ILIAS pages, `login_latency` to every Keycloak step and
+    `asset_latency` to each asset. With `require_login` ILIAS redirects to
+    login.php unless the request carries a session cookie from the login flow.
+    """
+    latency = float(os.environ.get("STANDIN_ILIAS_LATENCY", 0.05)) if latency is None else latency
+    asset_latency = float(os.environ.get("STANDIN_ILIAS_ASSET_LATENCY", 0.03)) if asset_latency is None else asset_latency
+    roster_size = int(os.environ.get("STANDIN_ILIAS_ROSTER_SIZE", 60)) if roster_size is None else roster_size
+    courses = int(os.environ.get("STANDIN_ILIAS_COURSES", 15)) if courses is None else courses
+    page_size = int(os.environ.get("STANDIN_ILIAS_PAGE_SIZE", 50)) if page_size is None else page_size
+    login_latency = float(os.environ.get("STANDIN_LOGIN_LATENCY", 0.1)) if login_latency is None else login_latency
+    password = password or os.environ.get("STANDIN_PASSWORD", "secret")
+    otp = otp or os.environ.get("STANDIN_OTP", "123456")
+    if require_login is None:
+        require_login = os.environ.get("STANDIN_REQUIRE_LOGIN", "1").lower() in ("1", "true", "yes", "on")
+    app = FastAPI()
+    overview = _with_assets(membership_overview_html(n_courses=courses, n_groups=courses // 3))
+    dashboard = _with_assets(dashboard_html())
+    rosters = {}
+    # (PHPSESSID, table prefix) -> rows per page the user chose
+    table_rows = {}
+    # session_code -> login flow state, id_token -> username, PHPSESSID -> username
+    flows = {}
+    id_tokens = {}
+    ilias_sessions = {}
+
+    @app.get("/realms/hhn/protocol/openid-connect/auth")
+    async def auth(request: Request):
+        await asyncio.sleep(login_latency)
+        session_code = secrets.token_urlsafe(16)
+        flows[session_code] = {
+            "step": "password",
+            "redirect_uri": request.query_params.get("redirect_uri", "/openidconnect.php"),
+            "state": request.query_params.get("state", ""),
+        }
+        return _keycloak_page(_LOGIN_FORM.format(action=_authenticate_action(session_code), username=''))
+
+    @app.post("/realms/hhn/login-actions/authenticate")
+    async def authenticate(request: Request):
+        await asyncio.sleep(login_latency)
+        session_code = request.query_params.get("session_code", "")
+        flow = flows.get(session_code)
+        if flow is None:
+            return _keycloak_page('<p id="kc-page-title">Page has expired</p>',
+                                  error="Your login attempt timed out. Login will start from the beginning.")
+        form = dict(parse_qsl((await request.body()).decode()))
+        action = _authenticate_action(session_code)
+
+        if flow["step"] == "password":
+            if form.get("password") != password or not form.get("username"):
+                return _keycloak_page(_LOGIN_FORM.format(action=action, username=html.escape(form.get("username", ""))),
+                                      error="Invalid username or password.")
+            flow.update(step="method", username=form["username"])
+            return _keycloak_page(_SECURITY_KEY_FORM.format(action=action))
+        if flow["step"] == "method" and form.get("tryAnotherWay") == "on":
+            flow["step"] = "select"
+            return _keycloak_page(_SELECT_AUTHENTICATOR_FORM.format(action=action))
+        if flow["step"] == "select" and form.get("authenticationExecution") == "otp":
+            flow["step"] = "otp"
+            return _keycloak_page(_OTP_FORM.format(action=action))
+        if flow["step"] == "otp":
+            if form.get("otp") != otp:
+                return _keycloak_page(_OTP_FORM.format(action=action), error="Invalid authenticator code.")
+            del flows[session_code]
+            id_token = secrets.token_urlsafe(32)
+            id_tokens[id_token] = flow["username"]
+            return HTMLResponse(_FORM_POST.format(redirect_uri=html.escape(flow["redirect_uri"]),
+                                                  state=html.escape(flow["state"]), id_token=id_token))
+        return _keycloak_page('<p id="kc-page-title">Unexpected step</p>', error="Unexpected error when authenticating.")
+
+    @app.post("/openidconnect.php")
+    async def openidconnect(request: Request):
+        await asyncio.sleep(latency)
+        form = dict(parse_qsl((await request.body()).decode()))
+        username = id_tokens.pop(form.get("id_token", ""), None)
+        if username is None:
+            return RedirectResponse("/login.php", status_code=303)
+        session_id = secrets.token_hex(16)
+        ilias_sessions[session_id] = username
+        response = RedirectResponse(DASHBOARD_PATH, status_code=303)
+        response.set_cookie("PHPSESSID", session_id, path="/", httponly=True)
+        return response
+
+    @app.get("/login.php", response_class=HTMLResponse)
+    async def login_page():
+        await asyncio.sleep(latency)
+        return HTMLResponse('<!DOCTYPE html><html><head><title>ILIAS Login</title></head>'
+                            '<body><a href="/openidconnect.php">Login mit HHN-Account</a></body></html>')
+
+    @app.get("/ilias.php", response_class=HTMLResponse)
+    async def ilias(request: Request):
+        await asyncio.sleep(latency)
+        if require_login and request.cookies.get("PHPSESSID") not in ilias_sessions:
+            return RedirectResponse("/login.php?" + urlencode({"target": str(request.url)}), status_code=302)
+        if request.query_params.get("baseClass") == "ilDashboardGUI":
+            return HTMLResponse(dashboard)
+        if request.query_params.get("cmdClass") == "ilmemberexportgui":
+            ref_id = request.query_params.get("ref_id", "0")
+            return Response(member_export_csv(roster_size, seed=int(ref_id)), media_type="text/csv; charset=utf-8")
+        if request.query_params.get("cmdClass") == "ilCourseMembershipGUI":
+            # Paginated like ilTable2GUI: <prefix>_table_nav=field:dir:offset; <prefix>_trows=rows is
+            # kept as the user's table property and starts the table over at offset 0
+            ref_id = request.query_params.get("ref_id", "0")
+            prefix = f"crs_{ref_id}"
+            offset = int(request.query_params.get(prefix + "_table_nav", "::0").rsplit(":", 1)[-1] or 0)
+            table = (request.cookies.get("PHPSESSID"), prefix)
+            if prefix + "_trows" in request.query_params:
+                table_rows[table] = min(int(request.query_params[prefix + "_trows"]), 800)
+                offset = 0
+            rows = table_rows.get(table, page_size)
+            key = (ref_id, offset, rows)
+            if key not in rosters:
+                rosters[key] = _with_assets(course_members_html(roster_size, ref_id=ref_id, seed=int(ref_id),
+                                                                offset=offset, page_size=rows))
+            return HTMLResponse(rosters[key])
+        return HTMLResponse(overview)
+
+    @app.get("/{asset_path:path}")
+    async def asset(asset_path: str):
+        extension = os.path.splitext(asset_path)[1]
+        if extension not in _CONTENT_TYPES:
+            return Response(status_code=404)
+        await asyncio.sleep(asset_latency)
+        return Response(b"/*" + b"x" * (_ASSET_SIZES[extension] - 4) + b"*/",
+                        media_type=_CONTENT_TYPES[extension])
+
+    return app
+
+
+app = create_app()
@@ -0,0 +1,240 @@
+"""End-to-end load test: N concurrent syncs against the ILIAS/Keycloak stand-in.
+
+Starts the stand-in in this process and the app under uvicorn in a child
+process whose UNISYNC_ILIAS_BASE_URL and UNISYNC_LOGIN_BASE_URL point at it.
+Every sync goes through /perform-sync, /submit-otp and the job result stream
+like the web page does. Reports throughput, p50/p95/p99 latency of the login
+(up to the OTP prompt) and of the whole sync, and the peak RSS of the app
+process together with its Chromium processes (Linux only). Other UNISYNC_*
+variables are passed on to the app, so configurations can be compared, e.g.
+UNISYNC_HTTP_FETCH=1. Needs a Playwright Chromium.
+
+    python -m benchmarks.loadtest [--syncs 10] [--rounds 1] [--courses 15] [--roster-size 60]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.ilias_standin import create_app
+from benchmarks.server import free_port, serve, shutdown
+
+PASSWORD = 'secret'
+OTP = '123456'
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of `values` (0 < q <= 100)."""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[max(0, -(-len(ordered) * q // 100) - 1)]
+
+
+def _rss_kib(pid):
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid):
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as stat:
+                    # The command name may contain spaces; the parent pid follows its closing parenthesis
+                    parent = int(stat.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(parent, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def process_tree_rss(pid):
+    """Resident memory in KiB of `pid` and all of its descendants."""
+    return sum(_rss_kib(process) for process in _children(pid))
+
+
+async def sample_peak_rss(pid, peak, interval=0.1):
+    while True:
+        peak['kib'] = max(peak['kib'], await asyncio.to_thread(process_tree_rss, pid))
+        await asyncio.sleep(interval)
+
+
+async def wait_for_phase(client, job_id, phases, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        job = (await client.get(f'/jobs/{job_id}')).json()
+        if job['status'] in phases or job['status'] in ('done', 'failed', 'cancelled'):
+            return job
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f"Job {job_id} did not reach {sorted(phases)} within {timeout} s")
+
+
+async def read_summary(client, job_id, timeout):
+    async with client.stream('GET', f'/jobs/{job_id}/stream', timeout=timeout) as response:
+        async for line in response.aiter_lines():
+            if line:
+                record = json.loads(line)
+                if record['type'] == 'summary':
+                    return record
+    raise RuntimeError(f"Result stream of job {job_id} ended without a summary")
+
+
+async def run_sync(client, username, timeout):
+    """Runs one sync like the web page does; returns its timings and outcome."""
+    start = time.perf_counter()
+    result = {'username': username, 'ok': False}
+    try:
+        response = await client.post('/perform-sync', json={'username': username, 'password': PASSWORD})
+        response.raise_for_status()
+        queued = response.json()
+        job = await wait_for_phase(client, queued['job_id'], {'otp_wait'}, timeout)
+        if job['status'] != 'otp_wait':
+            result['error'] = job.get('message', job['status'])
+            return result
+        result['login'] = time.perf_counter() - start
+
+        response = await client.get('/submit-otp', params={'otp': OTP, 'session_id': queued['session_id']})
+        response.raise_for_status()
+        summary = await read_summary(client, queued['job_id'], timeout)
+        result['total'] = time.perf_counter() - start
+        result['courses'] = summary['courses_with_results']
+        result['ok'] = summary['status'] == 'done'
+        if not result['ok']:
+            result['error'] = summary.get('message', summary['status'])
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    return result
+
+
+async def run_user(client, index, rounds, timeout):
+    results = []
+    for _ in range(rounds):
+        results.append(await run_sync(client, f'loadtest{index:04d}', timeout))
+    return results
+
+
+async def wait_until_up(url, process=None, timeout=60.0):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"App exited with status {process.returncode}")
+            try:
+                # Only measure once the login contexts are prewarmed
+                if (await client.get(url + '/ready')).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"App at {url} did not come up within {timeout} s")
+
+
+def start_app(port, standin_port, args, state_dir):
+    env = dict(os.environ)
+    env.update({
+        'UNISYNC_ILIAS_BASE_URL': f'http://127.0.0.1:{standin_port}',
+        # Another host name keeps the Keycloak cookies apart from the ILIAS ones, as in production
+        'UNISYNC_LOGIN_BASE_URL': f'http://localhost:{standin_port}',
+        'UNISYNC_SESSION_MAX': env.get('UNISYNC_SESSION_MAX') or str(max(args.syncs, 20)),
+        'UNISYNC_SNAPSHOT_DIR': os.path.join(state_dir, 'snapshots'),
+        'UNISYNC_COURSE_CACHE_DIR': os.path.join(state_dir, 'courses'),
+        'UNISYNC_AUTH_CACHE': '0',
+    })
+    return subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app:app', '--host', '127.0.0.1',
+                             '--port', str(port), '--log-level', 'warning'],
+                            env=env, stdout=None if args.verbose else subprocess.DEVNULL)
+
+
+def report(results, elapsed, peak_rss_kib):
+    succeeded = [result for result in results if result['ok']]
+    failed = [result for result in results if not result['ok']]
+    print(f"{len(results)} syncs in {elapsed:.1f} s: {len(succeeded)} succeeded, {len(failed)} failed")
+    print(f"throughput      {len(succeeded) / elapsed:8.2f} syncs/s")
+    for name in ('login', 'total'):
+        values = [result[name] for result in succeeded]
+        print(f"{name + ' latency':<15} p50 {percentile(values, 50):7.2f} s  p95 {percentile(values, 95):7.2f} s"
+              f"  p99 {percentile(values, 99):7.2f} s")
+    if peak_rss_kib:
+        print(f"peak RSS        {peak_rss_kib / 1024:8.1f} MiB (app and browsers)")
+    for error in sorted({result['error'] for result in failed})[:5]:
+        print(f"  error: {error}")
+
+
+async def run(args):
+    standin = create_app(latency=args.latency, login_latency=args.login_latency, asset_latency=args.asset_latency,
+                         roster_size=args.roster_size, courses=args.courses, page_size=args.page_size,
+                         password=PASSWORD, otp=OTP)
+    standin_port = free_port()
+    server, server_task = await serve(standin, standin_port)
+    process = None
+    peak = {'kib': 0}
+    sampler = None
+    with tempfile.TemporaryDirectory() as state_dir:
+        try:
+            if args.app_url:
+                app_url = args.app_url.rstrip('/')
+                print(f"Using the app at {app_url}; it must be configured for the stand-in on port {standin_port}")
+            else:
+                port = free_port()
+                app_url = f'http://127.0.0.1:{port}'
+                process = start_app(port, standin_port, args, state_dir)
+            await wait_until_up(app_url, process)
+            if process is not None:
+                sampler = asyncio.create_task(sample_peak_rss(process.pid, peak))
+
+            limits = httpx.Limits(max_connections=args.syncs * 2 + 10)
+            async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=args.timeout) as client:
+                start = time.perf_counter()
+                per_user = await asyncio.gather(*(run_user(client, index, args.rounds, args.timeout)
+                                                  for index in range(args.syncs)))
+                elapsed = time.perf_counter() - start
+            report([result for results in per_user for result in results], elapsed, peak['kib'])
+        finally:
+            if sampler:
+                sampler.cancel()
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+            await shutdown(server, server_task)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--syncs', type=int, default=10, help='concurrent syncs (one user each)')
+    parser.add_argument('--rounds', type=int, default=1, help='syncs run one after another by every user')
+    parser.add_argument('--courses', type=int, default=15)
+    parser.add_argument('--roster-size', type=int, default=60)
+    parser.add_argument('--page-size', type=int, default=50, help='rows per page of the members table')
+    parser.add_argument('--latency', type=float, default=0.05, help='ILIAS page latency in seconds')
+    parser.add_argument('--login-latency', type=float, default=0.1, help='latency per Keycloak step in seconds')
+    parser.add_argument('--asset-latency', type=float, default=0.03, help='latency per asset in seconds')
+    parser.add_argument('--timeout', type=float, default=120.0, help='per-sync timeout in seconds')
+    parser.add_argument('--app-url', help='drive an already running app instead of starting one (no RSS figures)')
+    parser.add_argument('--verbose', action='store_true', help="show the app's output")
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == '__main__':
+    main()
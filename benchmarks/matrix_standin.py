@@ -0,0 +1,55 @@
+"""Local stand-in for the unifyhn.de room provisioning service.
+
+Accepts the same ``POST /add_user_to_rooms`` body as the real service (and
+``POST /remove_user_from_rooms`` with the same shape), keeps
+the resulting memberships in memory and can add latency and transient
+failures. Run it on its own with
+
+    uvicorn benchmarks.matrix_standin:app --port 8008
+
+or start it inside a benchmark with ``benchmarks.server.serve()``.
+"""
+import asyncio
+import os
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def create_app(latency=None, failure_rate=None, seed=0):
+    latency = float(os.environ.get("STANDIN_MATRIX_LATENCY", 0.02)) if latency is None else latency
+    failure_rate = float(os.environ.get("STANDIN_MATRIX_FAILURE_RATE", 0.0)) if failure_rate is None else failure_rate
+    rng = random.Random(seed)
+    app = FastAPI()
+    app.state.memberships = set()
+    app.state.calls = 0
+
+    @app.post("/add_user_to_rooms")
+    async def add_user_to_rooms(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        await asyncio.sleep(latency)
+        if rng.random() < failure_rate:
+            return JSONResponse({"error": "temporarily unavailable"}, status_code=503)
+        for room in body["rooms"]:
+            app.state.memberships.add((body["user_id"], room["room_name"]))
+        return JSONResponse({"user_id": body["user_id"], "rooms": body["rooms"], "status": "ok"})
+
+    @app.post("/remove_user_from_rooms")
+    async def remove_user_from_rooms(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        await asyncio.sleep(latency)
+        for room in body["rooms"]:
+            app.state.memberships.discard((body["user_id"], room["room_name"]))
+        return JSONResponse({"user_id": body["user_id"], "rooms": body["rooms"], "status": "ok"})
+
+    @app.get("/memberships")
+    async def memberships():
+        return {"count": len(app.state.memberships), "calls": app.state.calls}
+
+    return app
+
+
+app = create_app()
@@ -0,0 +1,25 @@
+"""Helpers to run a stand-in app with uvicorn inside a benchmark's event loop."""
+import asyncio
+import socket
+
+import uvicorn
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def serve(app, port):
+    """Starts `app` with uvicorn on 127.0.0.1:`port`; returns the server and its task."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+async def shutdown(server, task):
+    server.should_exit = True
+    await task
@@ -0,0 +1,237 @@
+import asyncio
+import os
+import time
+
+import config
+import process_memory
+from metrics import BROWSER_LAUNCH_SECONDS, BROWSER_RECYCLES, SESSIONS_REFUSED
+
+MB = 1024 * 1024
+
+
+class MemoryBudgetError(Exception):
+    """Raised when a new session would exceed the memory budget."""
+
+
+class BrowserPool:
+    """A single Playwright driver shared by a small pool of Chromium processes.
+
+    Sessions never get a browser of their own; they get an isolated
+    BrowserContext (own cookies and storage) on the least busy browser.
+
+    A browser that has opened `max_contexts` contexts or whose processes use
+    more than `max_rss_mb` is recycled: a fresh browser takes its place for
+    new sessions while the old one drains, and it is closed once its last
+    context is gone or after `drain_timeout` seconds.
+    """
+
+    def __init__(self, size=None, headless=None, health_check_interval=None, max_contexts=None, max_rss_mb=None,
+                 drain_timeout=None, memory_check_interval=None, memory_budget_mb=None, memory_reserve_mb=None,
+                 context_memory_mb=None):
+        self.size = max(1, size if size is not None else config.BROWSER_POOL_SIZE)
+        self.headless = config.BROWSER_HEADLESS if headless is None else headless
+        self.health_check_interval = (config.BROWSER_HEALTH_CHECK_INTERVAL
+                                      if health_check_interval is None else health_check_interval)
+        self.max_contexts = config.BROWSER_MAX_CONTEXTS if max_contexts is None else max_contexts
+        self.max_rss = (config.BROWSER_MAX_RSS_MB if max_rss_mb is None else max_rss_mb) * MB
+        self.drain_timeout = config.BROWSER_DRAIN_TIMEOUT if drain_timeout is None else drain_timeout
+        self.memory_check_interval = (config.MEMORY_CHECK_INTERVAL
+                                      if memory_check_interval is None else memory_check_interval)
+        self.memory_budget = (config.MEMORY_BUDGET_MB if memory_budget_mb is None else memory_budget_mb) * MB
+        self.memory_reserve = (config.MEMORY_RESERVE_MB if memory_reserve_mb is None else memory_reserve_mb) * MB
+        self.context_memory = (config.CONTEXT_MEMORY_MB if context_memory_mb is None else context_memory_mb) * MB
+        self._playwright = None
+        self._browsers = []
+        # browser -> {"marker", "pid", "opened" (contexts so far), "rss" (bytes)}
+        self._info = {}
+        # (browser, time recycling started) of browsers waiting for their contexts to close
+        self._draining = []
+        self._launches = 0
+        self._lock = asyncio.Lock()
+        self._health_task = None
+        self._memory_task = None
+        self.relaunches = 0
+        self.recycles = 0
+        self.refused = 0
+
+    async def start(self):
+        # Imported here, so importing the app does not pay for Playwright
+        from playwright.async_api import async_playwright
+
+        self._playwright = await async_playwright().start()
+        self._browsers = [None] * self.size
+        for index in range(self.size):
+            await self._launch(index)
+        if self.health_check_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+        if self.memory_check_interval > 0:
+            self._memory_task = asyncio.create_task(self._memory_loop())
+
+    async def stop(self):
+        for task in (self._health_task, self._memory_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._health_task = self._memory_task = None
+        for browser in self._browsers + [browser for browser, _ in self._draining]:
+            await self._close(browser)
+        self._browsers = []
+        self._draining = []
+        self._info = {}
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def _launch(self, index):
+        # The marker argument finds the browser's process, and with it the renderers, for the RSS checks
+        self._launches += 1
+        marker = f"--unisync-browser={os.getpid()}-{self._launches}"
+        with BROWSER_LAUNCH_SECONDS.time():
+            browser = await self._playwright.chromium.launch(headless=self.headless, args=[marker])
+        self._browsers[index] = browser
+        self._info[browser] = {"marker": marker, "pid": None, "opened": 0, "rss": 0}
+        return browser
+
+    async def _close(self, browser):
+        self._info.pop(browser, None)
+        if browser is not None and browser.is_connected():
+            try:
+                await browser.close()
+            except Exception as e:
+                print(f"Error closing browser: {str(e)}")
+
+    def _is_healthy(self, browser):
+        return browser is not None and browser.is_connected()
+
+    async def _ensure_healthy(self, index):
+        browser = self._browsers[index]
+        if self._is_healthy(browser):
+            return browser
+        print(f"Browser {index} is not connected, relaunching...")
+        self.relaunches += 1
+        self._info.pop(browser, None)
+        return await self._launch(index)
+
+    async def health_check(self):
+        """Relaunches every browser that crashed or lost its connection."""
+        async with self._lock:
+            for index in range(len(self._browsers)):
+                try:
+                    await self._ensure_healthy(index)
+                except Exception as e:
+                    print(f"Health check failed to relaunch browser {index}: {str(e)}")
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await self.health_check()
+
+    async def _recycle(self, index, reason):
+        """Launches a fresh browser in place of browser `index` and lets the old one drain."""
+        old = self._browsers[index]
+        print(f"Recycling browser {index} ({reason}), draining {len(old.contexts)} contexts")
+        self._draining.append((old, time.monotonic()))
+        try:
+            browser = await self._launch(index)
+        except Exception:
+            # Keep serving from the old browser rather than from none
+            self._draining.pop()
+            self._browsers[index] = old
+            raise
+        self.recycles += 1
+        BROWSER_RECYCLES.inc(reason=reason)
+        return browser
+
+    async def _close_drained(self):
+        now = time.monotonic()
+        for entry in list(self._draining):
+            browser, since = entry
+            if self._is_healthy(browser) and browser.contexts and now - since < self.drain_timeout:
+                continue
+            if self._is_healthy(browser) and browser.contexts:
+                print(f"Closing a recycled browser with {len(browser.contexts)} contexts left after "
+                      f"{self.drain_timeout:.0f} s")
+            self._draining.remove(entry)
+            await self._close(browser)
+
+    def _measure(self):
+        # Runs in a thread: /proc is read for every process on the host
+        infos = list(self._info.values())
+        for info in infos:
+            if info["pid"] is None:
+                info["pid"] = process_memory.find_pid(info["marker"])
+        sizes = process_memory.tree_rss([info["pid"] for info in infos if info["pid"] is not None])
+        if sizes is not None:
+            for info in infos:
+                if info["pid"] is not None:
+                    info["rss"] = sizes.get(info["pid"], 0)
+
+    async def check_memory(self):
+        """Measures every browser, recycles those over the RSS limit and closes the drained ones."""
+        await asyncio.to_thread(self._measure)
+        async with self._lock:
+            for index, browser in enumerate(self._browsers):
+                info = self._info.get(browser)
+                if self.max_rss and info and info["rss"] > self.max_rss and self._is_healthy(browser):
+                    try:
+                        await self._recycle(index, 'memory')
+                    except Exception as e:
+                        print(f"Failed to recycle browser {index}: {str(e)}")
+            await self._close_drained()
+
+    async def _memory_loop(self):
+        while True:
+            await asyncio.sleep(self.memory_check_interval)
+            await self.check_memory()
+
+    def memory_used(self):
+        """Resident bytes of all browsers at the latest check, draining ones included."""
+        return sum(info["rss"] for info in self._info.values())
+
+    def memory_error(self):
+        """Why one more session would not fit in memory, or None if it fits."""
+        if self.memory_budget and self.memory_used() + self.context_memory > self.memory_budget:
+            return (f"Browsers use {self.memory_used() // MB} MB of the "
+                    f"{self.memory_budget // MB} MB memory budget")
+        available = process_memory.host_available_memory()
+        if available is not None and available - self.context_memory < self.memory_reserve:
+            return f"Only {available // MB} MB of memory is available"
+        return None
+
+    def check_memory_budget(self):
+        """Raises MemoryBudgetError if one more session would not fit in memory."""
+        error = self.memory_error()
+        if error:
+            self.refused += 1
+            SESSIONS_REFUSED.inc()
+            raise MemoryBudgetError(f"{error}, please try again later")
+
+    async def new_context(self, **kwargs):
+        """Opens an isolated BrowserContext on the browser with the fewest open contexts."""
+        if self._playwright is None:
+            raise RuntimeError("Browser pool is not started")
+        async with self._lock:
+            index = min(range(len(self._browsers)),
+                        key=lambda i: len(self._browsers[i].contexts) if self._is_healthy(self._browsers[i]) else 0)
+            browser = await self._ensure_healthy(index)
+            if self.max_contexts and self._info[browser]["opened"] >= self.max_contexts:
+                browser = await self._recycle(index, 'contexts')
+            self._info[browser]["opened"] += 1
+        return await browser.new_context(**kwargs)
+
+    def stats(self):
+        browsers = [browser for browser in self._browsers + [browser for browser, _ in self._draining]
+                    if self._is_healthy(browser)]
+        return {
+            "size": self.size,
+            "connected": sum(1 for browser in self._browsers if self._is_healthy(browser)),
+            "contexts": sum(len(browser.contexts) for browser in browsers),
+            "relaunches": self.relaunches,
+            "recycles": self.recycles,
+            "draining": len(self._draining),
+            "memory_mb": self.memory_used() // MB,
+            "refused": self.refused,
+        }
@@ -0,0 +1,132 @@
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# ILIAS and its Keycloak login; point both at benchmarks.ilias_standin to run offline
+ILIAS_BASE_URL = os.environ.get("UNISYNC_ILIAS_BASE_URL", "https://ilias.hs-heilbronn.de").rstrip("/")
+LOGIN_BASE_URL = os.environ.get("UNISYNC_LOGIN_BASE_URL", "https://login.hs-heilbronn.de").rstrip("/")
+
+# Login: each step waits for every possible next page at once, up to these timeouts
+LOGIN_STEP_TIMEOUT = _env_float("UNISYNC_LOGIN_STEP_TIMEOUT", 30.0)
+LOGIN_DASHBOARD_TIMEOUT = _env_float("UNISYNC_LOGIN_DASHBOARD_TIMEOUT", 60.0)
+
+# Browser pool
+BROWSER_POOL_SIZE = _env_int("UNISYNC_BROWSER_POOL_SIZE", 2)
+BROWSER_HEADLESS = _env_bool("UNISYNC_BROWSER_HEADLESS", True)
+BROWSER_HEALTH_CHECK_INTERVAL = _env_float("UNISYNC_BROWSER_HEALTH_CHECK_INTERVAL", 30.0)
+
+# Memory governor: a browser is recycled after BROWSER_MAX_CONTEXTS contexts or once its
+# processes use more than BROWSER_MAX_RSS_MB, after draining its sessions for at most
+# BROWSER_DRAIN_TIMEOUT seconds. A new session is refused if its estimated CONTEXT_MEMORY_MB
+# would take this process's browsers past MEMORY_BUDGET_MB (0: no limit) or leave the host
+# with less than MEMORY_RESERVE_MB available.
+BROWSER_MAX_CONTEXTS = _env_int("UNISYNC_BROWSER_MAX_CONTEXTS", 200)
+BROWSER_MAX_RSS_MB = _env_int("UNISYNC_BROWSER_MAX_RSS_MB", 1536)
+BROWSER_DRAIN_TIMEOUT = _env_float("UNISYNC_BROWSER_DRAIN_TIMEOUT", 900.0)
+MEMORY_CHECK_INTERVAL = _env_float("UNISYNC_MEMORY_CHECK_INTERVAL", 10.0)
+MEMORY_BUDGET_MB = _env_int("UNISYNC_MEMORY_BUDGET_MB", 0)
+MEMORY_RESERVE_MB = _env_int("UNISYNC_MEMORY_RESERVE_MB", 512)
+CONTEXT_MEMORY_MB = _env_int("UNISYNC_CONTEXT_MEMORY_MB", 150)
+
+# Contexts kept open on the Keycloak login form, replaced after PREWARM_MAX_AGE seconds
+PREWARM_CONTEXTS = _env_int("UNISYNC_PREWARM_CONTEXTS", 2)
+PREWARM_MAX_AGE = _env_float("UNISYNC_PREWARM_MAX_AGE", 300.0)
+
+# Course scraping: number of pages fetching course membership pages in parallel
+SCRAPE_CONCURRENCY = _env_int("UNISYNC_SCRAPE_CONCURRENCY", 3)
+
+# Browser-free HTTP fetching of course pages after login
+HTTP_FETCH = _env_bool("UNISYNC_HTTP_FETCH", False)
+HTTP_TIMEOUT = _env_float("UNISYNC_HTTP_TIMEOUT", 30.0)
+HTTP_MAX_CONNECTIONS = _env_int("UNISYNC_HTTP_MAX_CONNECTIONS", 20)
+
+# HTML extraction backend: "lxml" (fast, parses only the relevant markup) or "bs4"
+PARSER_BACKEND = os.environ.get("UNISYNC_PARSER_BACKEND", "lxml")
+# Processes parsing ILIAS pages off the event loop (0 parses in the event loop)
+PARSER_PROCESSES = _env_int("UNISYNC_PARSER_PROCESSES", 2)
+EVENT_LOOP_LAG_INTERVAL = _env_float("UNISYNC_EVENT_LOOP_LAG_INTERVAL", 0.5)
+
+# Matrix provisioning
+MATRIX_BASE_URL = os.environ.get("UNISYNC_MATRIX_BASE_URL", "http://unifyhn.de")
+MATRIX_SERVER_NAME = os.environ.get("UNISYNC_MATRIX_SERVER_NAME", "unifyhn.de")
+MATRIX_PROVISIONING = _env_bool("UNISYNC_MATRIX_PROVISIONING", False)
+MATRIX_MAX_IN_FLIGHT = _env_int("UNISYNC_MATRIX_MAX_IN_FLIGHT", 8)
+MATRIX_RETRIES = _env_int("UNISYNC_MATRIX_RETRIES", 3)
+MATRIX_BACKOFF = _env_float("UNISYNC_MATRIX_BACKOFF", 0.5)
+MATRIX_TIMEOUT = _env_float("UNISYNC_MATRIX_TIMEOUT", 15.0)
+
+# Screenshots streamed to the browser while the user waits for the OTP step
+# Frames are only taken while a client watches: at most one per SCREENSHOT_INTERVAL seconds,
+# on every login step and every SCREENSHOT_REFRESH seconds (0: login steps only), downscaled
+# to SCREENSHOT_WIDTH pixels and encoded as SCREENSHOT_FORMAT ("jpeg" or "webp")
+SCREENSHOT_QUALITY = _env_int("UNISYNC_SCREENSHOT_QUALITY", 60)
+SCREENSHOT_FORMAT = os.environ.get("UNISYNC_SCREENSHOT_FORMAT", "jpeg")
+SCREENSHOT_WIDTH = _env_int("UNISYNC_SCREENSHOT_WIDTH", 640)
+SCREENSHOT_INTERVAL = _env_float("UNISYNC_SCREENSHOT_INTERVAL", 1.0)
+SCREENSHOT_REFRESH = _env_float("UNISYNC_SCREENSHOT_REFRESH", 5.0)
+SCREENSHOT_STREAM_KEEPALIVE = _env_float("UNISYNC_SCREENSHOT_STREAM_KEEPALIVE", 15.0)
+
+# Background sync jobs
+JOB_WORKERS = _env_int("UNISYNC_JOB_WORKERS", 4)
+JOB_RESULT_TTL = _env_float("UNISYNC_JOB_RESULT_TTL", 600.0)
+
+# Browser sessions: idle TTL, size cap and eviction policy ("lru" or "oldest")
+SESSION_IDLE_TTL = _env_float("UNISYNC_SESSION_IDLE_TTL", 600.0)
+SESSION_MAX = _env_int("UNISYNC_SESSION_MAX", 20)
+SESSION_EVICTION = os.environ.get("UNISYNC_SESSION_EVICTION", "lru")
+SESSION_REAP_INTERVAL = _env_float("UNISYNC_SESSION_REAP_INTERVAL", 30.0)
+
+# Incremental sync: per-course roster snapshots, only changes are sent to Matrix
+INCREMENTAL_SYNC = _env_bool("UNISYNC_INCREMENTAL_SYNC", True)
+SNAPSHOT_DIR = os.environ.get("UNISYNC_SNAPSHOT_DIR", os.path.join(".unisync", "snapshots"))
+MATRIX_REMOVE_MEMBERS = _env_bool("UNISYNC_MATRIX_REMOVE_MEMBERS", False)
+
+# Output of the static asset build (python assets.py): hashed, compressed files and the service worker
+ASSET_BUILD_DIR = os.environ.get("UNISYNC_ASSET_BUILD_DIR", "build")
+
+# Per-user cache of the parsed course list, so repeat syncs skip the membership overview
+COURSE_CACHE = _env_bool("UNISYNC_COURSE_CACHE", True)
+COURSE_CACHE_DIR = os.environ.get("UNISYNC_COURSE_CACHE_DIR", os.path.join(".unisync", "courses"))
+COURSE_CACHE_TTL = _env_float("UNISYNC_COURSE_CACHE_TTL", 24 * 3600.0)
+
+# Opt-in cache of the authenticated Playwright storage state (encrypted with Fernet)
+AUTH_CACHE = _env_bool("UNISYNC_AUTH_CACHE", False)
+AUTH_CACHE_KEY = os.environ.get("UNISYNC_AUTH_CACHE_KEY", "")
+AUTH_CACHE_DIR = os.environ.get("UNISYNC_AUTH_CACHE_DIR", os.path.join(".unisync", "auth"))
+AUTH_CACHE_TTL = _env_float("UNISYNC_AUTH_CACHE_TTL", 8 * 3600.0)
+
+# Request interception: block assets the login form and the scrape do not need
+SCRAPE_PROFILES = _env_bool("UNISYNC_SCRAPE_PROFILES", True)
+
+# How course rosters are retrieved: "table" (first rendered page only), "paged"
+# (largest page size, following the table's pagination) or "export" (member CSV)
+ROSTER_MODE = os.environ.get("UNISYNC_ROSTER_MODE", "paged")
+ROSTER_PAGE_SIZE = _env_int("UNISYNC_ROSTER_PAGE_SIZE", 800)
+MEMBER_EXPORT_URL = os.environ.get(
+    "UNISYNC_MEMBER_EXPORT_URL",
+    ILIAS_BASE_URL + "/ilias.php?baseClass=ilrepositorygui&cmdClass=ilmemberexportgui"
+    "&cmd=exportMembers&format=csv&ref_id={ref_id}")
+
+# Multi-process mode (gateway.py): browser worker processes behind a routing gateway
+WORKER_ID = os.environ.get("UNISYNC_WORKER_ID", "0")
+GATEWAY_WORKERS = _env_int("UNISYNC_GATEWAY_WORKERS", os.cpu_count() or 1)
+GATEWAY_WORKER_APP = os.environ.get("UNISYNC_GATEWAY_WORKER_APP", "app:app")
+GATEWAY_SOCKET_DIR = os.environ.get("UNISYNC_GATEWAY_SOCKET_DIR", os.path.join(".unisync", "workers"))
+GATEWAY_CAPACITY_INTERVAL = _env_float("UNISYNC_GATEWAY_CAPACITY_INTERVAL", 2.0)
+GATEWAY_WORKER_START_TIMEOUT = _env_float("UNISYNC_GATEWAY_WORKER_START_TIMEOUT", 60.0)
@@ -0,0 +1,50 @@
+import json
+import os
+import time
+
+import config
+from file_store import atomic_write, key_path
+
+
+class CourseListCache:
+    """Parsed course list (name, refId, url) of every user, one JSON file per user.
+
+    Entries older than the TTL are ignored. Being on disk, the cache is shared
+    by all worker processes, so a repeat sync finds it on whichever worker it
+    lands.
+    """
+
+    def __init__(self, directory=None, ttl=None, enabled=None):
+        self.directory = directory or config.COURSE_CACHE_DIR
+        self.ttl = config.COURSE_CACHE_TTL if ttl is None else ttl
+        self.enabled = config.COURSE_CACHE if enabled is None else enabled
+
+    def path(self, user_key):
+        return key_path(self.directory, user_key, ".json")
+
+    def load(self, user_key):
+        """Returns the cached courses, or None if missing or expired."""
+        if not self.enabled:
+            return None
+        try:
+            with open(self.path(user_key), encoding="utf-8") as cache_file:
+                entry = json.load(cache_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable course list: {str(e)}")
+            return None
+        if time.time() - entry.get("saved_at", 0) > self.ttl:
+            return None
+        return entry["courses"]
+
+    def save(self, user_key, courses):
+        if not self.enabled:
+            return
+        atomic_write(self.path(user_key), json.dumps({"saved_at": time.time(), "courses": courses}), dir_mode=0o700)
+
+    def invalidate(self, user_key):
+        try:
+            os.unlink(self.path(user_key))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,142 @@
+import re
+
+import lxml.html
+
+import config
+from metrics import HTML_PARSE_SECONDS
+
+MEMBERS_TABLE_CLASS = 'table table-striped fullwidth'
+
+# Where the interesting markup starts. The fast backend parses from here on and
+# skips the page header, navigation and menus above it.
+_COURSE_ROWS_START = re.compile(r'<[a-zA-Z][^>]*\sclass=["\'][^"\']*\bil-std-item\b')
+_MEMBERS_TABLE_START = re.compile(r'<table[^>]*\sclass=["\']' + re.escape(MEMBERS_TABLE_CLASS) + r'["\']')
+
+_HAS_CLASS = "contains(concat(' ', normalize-space(@class), ' '), ' {} ')"
+_COURSE_ROWS = lxml.etree.XPath('//*[' + _HAS_CLASS.format('il-std-item') + ']')
+_ROW_ICON = lxml.etree.XPath('.//img[' + _HAS_CLASS.format('icon') + ']')
+_ROW_TITLE_LINK = lxml.etree.XPath('.//*[' + _HAS_CLASS.format('il-item-title') + ']//a')
+_MEMBERS_TABLE = lxml.etree.XPath('//table[@class=$cls]')
+
+
+def get_ref_id(url):
+    match = re.search(r'ref_id=(\d+)', url)
+    return match.group(1) if match else ''
+
+
+def _parse_from(html_content, start_pattern):
+    """Parses `html_content` with lxml, starting at the first match of `start_pattern`."""
+    match = start_pattern.search(html_content)
+    if match:
+        html_content = html_content[match.start():]
+    if not html_content.strip():
+        return None
+    return lxml.html.fromstring(html_content)
+
+
+def _stripped_text(element):
+    # Same result as BeautifulSoup's get_text(strip=True)
+    return ''.join(text.strip() for text in element.itertext() if text.strip())
+
+
+def extract_courses_bs4(html_content):
+    # BeautifulSoup is only imported when the bs4 backend is used
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html_content, 'html.parser')
+    courses = []
+
+    course_rows = soup.select('.il-std-item')
+    for course_row in course_rows:
+        img_element = course_row.select_one('img.icon')
+        if img_element and img_element.get('alt') != 'Symbol Gruppe':
+            course_name_element = course_row.select_one('.il-item-title a')
+            if course_name_element:
+                course_name = course_name_element.get_text(strip=True)
+                course_url = course_name_element.get('href')
+                course_ref_id = get_ref_id(course_url)
+                courses.append({
+                    'name': course_name,
+                    'refId': course_ref_id,
+                    'url': course_url,
+                })
+
+    return courses
+
+
+def extract_email_column_from_table_bs4(html_content):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html_content, 'html.parser')
+    table = soup.find('table', {'class': MEMBERS_TABLE_CLASS})
+    email_column_data = []
+
+    if table and table.find('tbody'):
+        for row in table.find('tbody').find_all('tr'):
+            columns = row.find_all('td')
+            if len(columns) >= 5:
+                email_column_data.append(columns[4].text.strip())
+
+    return email_column_data
+
+
+def extract_courses_lxml(html_content):
+    root = _parse_from(html_content, _COURSE_ROWS_START)
+    courses = []
+    if root is None:
+        return courses
+
+    for course_row in _COURSE_ROWS(root):
+        img_elements = _ROW_ICON(course_row)
+        if img_elements and img_elements[0].get('alt') != 'Symbol Gruppe':
+            course_name_elements = _ROW_TITLE_LINK(course_row)
+            if course_name_elements:
+                course_name_element = course_name_elements[0]
+                course_url = course_name_element.get('href')
+                courses.append({
+                    'name': _stripped_text(course_name_element),
+                    'refId': get_ref_id(course_url),
+                    'url': course_url,
+                })
+
+    return courses
+
+
+def extract_email_column_from_table_lxml(html_content):
+    root = _parse_from(html_content, _MEMBERS_TABLE_START)
+    email_column_data = []
+    if root is None:
+        return email_column_data
+
+    tables = _MEMBERS_TABLE(root, cls=MEMBERS_TABLE_CLASS)
+    tbody = next(tables[0].iter('tbody'), None) if tables else None
+    if tbody is not None:
+        for row in tbody.iter('tr'):
+            columns = list(row.iter('td'))
+            if len(columns) >= 5:
+                email_column_data.append(columns[4].text_content().strip())
+
+    return email_column_data
+
+
+BACKENDS = {
+    'bs4': (extract_courses_bs4, extract_email_column_from_table_bs4),
+    'lxml': (extract_courses_lxml, extract_email_column_from_table_lxml),
+}
+
+
+def _backend(backend):
+    name = backend or config.PARSER_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown parser backend {name!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name]
+
+
+def extract_courses(html_content, backend=None):
+    with HTML_PARSE_SECONDS.time(page='courses'):
+        return _backend(backend)[0](html_content)
+
+
+def extract_email_column_from_table(html_content, backend=None):
+    with HTML_PARSE_SECONDS.time(page='members'):
+        return _backend(backend)[1](html_content)
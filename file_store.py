@@ -0,0 +1,26 @@
+"""Helpers shared by the on-disk caches: per-key file names and atomic writes."""
+import hashlib
+import os
+import tempfile
+
+
+def key_path(directory, key, suffix):
+    """Path of the file for `key` (e.g. a user key), named by its hash so it is never in the clear."""
+    return os.path.join(directory, hashlib.sha256(key.encode()).hexdigest() + suffix)
+
+
+def atomic_write(path, data, dir_mode=0o777):
+    """Writes `data` (str or bytes) to `path` through a temporary file, so a
+    crash never leaves half a file; creates the directory with `dir_mode`."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=dir_mode, exist_ok=True)
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,190 @@
+"""API gateway in front of several browser worker processes.
+
+    uvicorn gateway:app --host 0.0.0.0 --port 5001
+
+Starts UNISYNC_GATEWAY_WORKERS copies of the app, each with its own browser
+pool and sessions, listening on unix sockets in UNISYNC_GATEWAY_SOCKET_DIR.
+Every request is forwarded to the worker that owns its session or job, so
+logins and scraping run on all cores while the gateway itself only relays
+bytes. Session limits (UNISYNC_SESSION_MAX) apply per worker.
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import httpx
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from websockets.asyncio.client import unix_connect
+from websockets.exceptions import ConnectionClosed
+
+import metrics
+from sessions import session_id_for
+from workers import WorkerPool, WorkerUnavailableError
+
+worker_pool = WorkerPool()
+
+_HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers',
+                       'transfer-encoding', 'upgrade', 'host', 'content-length'}
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await worker_pool.start()
+    try:
+        yield
+    finally:
+        await worker_pool.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+
+def _forward_headers(headers):
+    return {name: value for name, value in headers.items() if name.lower() not in _HOP_BY_HOP_HEADERS}
+
+
+async def forward(worker, request, body=None):
+    """Relays `request` to `worker` and streams the answer back unchanged."""
+    if worker is None:
+        raise HTTPException(status_code=404, detail="Session or job not found")
+    upstream = worker.client.build_request(
+        request.method, request.url.path, params=request.query_params,
+        headers=_forward_headers(request.headers),
+        content=await request.body() if body is None else body)
+    try:
+        response = await worker.client.send(upstream, stream=True)
+    except httpx.TransportError:
+        raise HTTPException(status_code=502, detail=f"Browser worker {worker.index} is not reachable")
+    return StreamingResponse(response.aiter_raw(), status_code=response.status_code,
+                             headers=_forward_headers(response.headers), background=BackgroundTask(response.aclose))
+
+
+def _any_worker():
+    try:
+        return worker_pool.any_worker()
+    except WorkerUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@app.post("/perform-sync")
+async def perform_sync(request: Request):
+    body = await request.body()
+    try:
+        username = json.loads(body).get("username") or ""
+    except (ValueError, AttributeError):
+        username = ""
+    if not username:
+        # Let a worker answer with its usual validation error
+        return await forward(_any_worker(), request, body)
+
+    try:
+        worker = worker_pool.place(session_id_for(username))
+    except WorkerUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    try:
+        response = await worker.client.post("/perform-sync", content=body, headers=_forward_headers(request.headers))
+    except httpx.TransportError:
+        raise HTTPException(status_code=502, detail=f"Browser worker {worker.index} is not reachable")
+    if response.status_code == 202:
+        worker_pool.route_job(response.json()["job_id"], worker)
+    return Response(response.content, status_code=response.status_code, headers=_forward_headers(response.headers))
+
+
+@app.get("/submit-otp")
+async def submit_otp(request: Request, session_id: str = Query(...)):
+    return await forward(await worker_pool.session_owner(session_id), request)
+
+
+@app.get("/screenshot")
+async def get_screenshot(request: Request, session_id: str = Query(...)):
+    return await forward(await worker_pool.session_owner(session_id), request)
+
+
+@app.api_route("/jobs/{job_id}", methods=["GET", "DELETE"])
+async def job(request: Request, job_id: str):
+    return await forward(await worker_pool.job_owner(job_id), request)
+
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(request: Request, job_id: str):
+    return await forward(await worker_pool.job_owner(job_id), request)
+
+
+@app.websocket("/ws/screenshot")
+async def stream_screenshots(websocket: WebSocket, session_id: str = Query(...)):
+    """Relays the worker's screenshot stream; closes the worker connection when the client leaves."""
+    worker = await worker_pool.session_owner(session_id)
+    await websocket.accept()
+    if worker is None:
+        await websocket.close()
+        return
+
+    async def relay(upstream):
+        async for frame in upstream:
+            if isinstance(frame, bytes):
+                await websocket.send_bytes(frame)
+            else:
+                await websocket.send_text(frame)
+        await websocket.close()
+
+    async def wait_for_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    try:
+        async with unix_connect(worker.socket_path, f"ws://worker{websocket.url.path}?{websocket.url.query}") as upstream:
+            tasks = [asyncio.create_task(relay(upstream)), asyncio.create_task(wait_for_disconnect())]
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            # Raises what ended the relay, if anything
+            for task in done:
+                task.result()
+    except (ConnectionClosed, OSError):
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+
+@app.get("/ready")
+async def ready():
+    """200 once every running browser worker has finished prewarming."""
+    workers = [worker for worker in worker_pool.workers if worker.alive]
+    is_ready = bool(workers) and all(worker.available and worker.capacity.get("ready", True) for worker in workers)
+    return JSONResponse({"ready": is_ready, "workers": len(workers)}, status_code=200 if is_ready else 503)
+
+
+@app.get("/workers")
+async def workers():
+    """Capacity reported by every browser worker."""
+    return JSONResponse({"workers": worker_pool.stats()})
+
+
+async def _from_every_worker(path):
+    workers = [worker for worker in worker_pool.workers if worker.available]
+    responses = await asyncio.gather(*(worker.client.get(path) for worker in workers), return_exceptions=True)
+    return [(worker, response) for worker, response in zip(workers, responses)
+            if not isinstance(response, Exception) and response.status_code == 200]
+
+
+@app.get("/sessions/stats")
+async def session_stats():
+    return JSONResponse({"workers": [dict(response.json(), worker=worker.index)
+                                     for worker, response in await _from_every_worker("/sessions/stats")]})
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """The metrics of all workers, each series labelled with its worker."""
+    expositions = [(str(worker.index), response.text) for worker, response in await _from_every_worker("/metrics")]
+    return PlainTextResponse(metrics.merge(expositions, "worker"), media_type=metrics.CONTENT_TYPE)
+
+
+@app.api_route("/{path:path}", methods=["GET", "HEAD", "POST", "PUT", "DELETE"])
+async def other(request: Request, path: str):
+    # Pages and everything else that is not tied to a session
+    return await forward(_any_worker(), request)
@@ -0,0 +1,148 @@
+import http.cookiejar
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import httpx
+
+import config
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class SessionExpiredError(Exception):
+    """Raised when ILIAS answers a cookie-authenticated request with a login page."""
+
+
+class _RejectAllCookiesPolicy(http.cookiejar.DefaultCookiePolicy):
+    # The client is shared by all sessions, so it must never remember cookies
+    # from a response; each request carries its own session's Cookie header.
+    def set_ok(self, cookie, request):
+        return False
+
+
+_client = None
+MAX_REDIRECTS = 20
+
+
+def get_client():
+    """Returns the process-wide keep-alive client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            # IliasHttpSession follows redirects itself, to keep its cookies on them
+            follow_redirects=False,
+            timeout=config.HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=config.HTTP_MAX_CONNECTIONS,
+                                max_keepalive_connections=config.HTTP_MAX_CONNECTIONS),
+            cookies=http.cookiejar.CookieJar(policy=_RejectAllCookiesPolicy()),
+            headers={"Accept": "text/html,application/xhtml+xml"},
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _domain_matches(host, domain):
+    domain = domain.lstrip(".")
+    return host == domain or host.endswith("." + domain)
+
+
+def cookie_header(cookies, url):
+    """Builds a Cookie header for `url` from Playwright `context.cookies()` entries."""
+    parts = urlsplit(url)
+    host = parts.hostname or ""
+    path = parts.path or "/"
+    return "; ".join(
+        f"{cookie['name']}={cookie['value']}"
+        for cookie in cookies
+        if _domain_matches(host, cookie.get("domain", ""))
+        and path.startswith(cookie.get("path") or "/")
+        and (parts.scheme == "https" or not cookie.get("secure"))
+    )
+
+
+def _is_login_response(response, requested_url):
+    if response.status_code in (401, 403):
+        return True
+    if response.url.host != urlsplit(requested_url).hostname:
+        return True
+    return "login.php" in response.url.path
+
+
+class IliasHttpSession:
+    """Fetches ILIAS pages with the cookies of an authenticated browser session.
+
+    Only the HTML document is requested: no scripts, stylesheets or images are
+    loaded and nothing is rendered. Redirects are followed here rather than by
+    httpx, which drops the Cookie header on every redirect; cookies set along
+    the way are kept for the following requests.
+    """
+
+    def __init__(self, cookies, client=None):
+        self.cookies = list(cookies)
+        self.client = client or get_client()
+
+    @classmethod
+    async def from_context(cls, context, client=None):
+        return cls(await context.cookies(), client=client)
+
+    def _remember(self, response):
+        for cookie in response.cookies.jar:
+            domain = cookie.domain or response.url.host
+            path = cookie.path or "/"
+            self.cookies = [known for known in self.cookies
+                            if (known["name"], known.get("domain", "").lstrip("."), known.get("path") or "/")
+                            != (cookie.name, domain.lstrip("."), path)]
+            self.cookies.append({"name": cookie.name, "value": cookie.value, "domain": domain, "path": path,
+                                 "secure": bool(cookie.secure)})
+
+    async def _send(self, url, stream=False):
+        """The response at the end of the redirects from `url`, each request with its cookies."""
+        for _ in range(MAX_REDIRECTS + 1):
+            request = self.client.build_request("GET", url, headers={"Cookie": cookie_header(self.cookies, url)})
+            response = await self.client.send(request, stream=stream, follow_redirects=False)
+            self._remember(response)
+            if not response.is_redirect:
+                return response
+            await response.aclose()
+            url = str(response.next_request.url)
+        raise httpx.TooManyRedirects(f"Exceeded {MAX_REDIRECTS} redirects fetching {url}", request=request)
+
+    async def get(self, url):
+        response = await self._send(url)
+        if _is_login_response(response, url):
+            raise SessionExpiredError(f"ILIAS session expired while fetching {url}")
+        response.raise_for_status()
+        return response.text
+
+    @asynccontextmanager
+    async def _stream(self, url):
+        response = await self._send(url, stream=True)
+        try:
+            if _is_login_response(response, url):
+                raise SessionExpiredError(f"ILIAS session expired while fetching {url}")
+            response.raise_for_status()
+            yield response
+        finally:
+            await response.aclose()
+
+    async def iter_text(self, url):
+        """Yields the body of `url` in decoded chunks as it arrives."""
+        async with self._stream(url) as response:
+            async for chunk in response.aiter_text():
+                yield chunk
+
+    async def iter_lines(self, url):
+        async with self._stream(url) as response:
+            async for line in response.aiter_lines():
+                yield line
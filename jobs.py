@@ -0,0 +1,224 @@
+import asyncio
+import time
+import uuid
+
+import config
+from metrics import FAILURES
+
+QUEUED = 'queued'
+LOGIN = 'login'
+OTP_WAIT = 'otp_wait'
+SCRAPING = 'scraping'
+PROVISIONING = 'provisioning'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_PHASES = {DONE, FAILED, CANCELLED}
+
+
+class Job:
+    """State of one sync as seen through the job-status endpoint.
+
+    A sync runs as several stages (login, then scraping after the OTP has been
+    submitted); each stage is queued separately so no worker sits idle while
+    the user types the OTP.
+    """
+
+    def __init__(self, session_id):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.phase = QUEUED
+        self.courses_total = 0
+        self.courses_done = 0
+        self.results = []
+        self.provisioning = None
+        self.error = None
+        self.reason = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.task = None
+        self.cancel_reason = None
+        self._subscribers = []
+
+    @property
+    def finished(self):
+        return self.phase in FINISHED_PHASES
+
+    def set_phase(self, phase):
+        if not self.finished:
+            self.phase = phase
+
+    def start_scraping(self, courses_total, done=0):
+        self.courses_total = courses_total
+        self.courses_done = done
+        self.set_phase(SCRAPING)
+
+    def course_scraped(self, result):
+        self.courses_done += 1
+        if result is not None:
+            self.results.append(result)
+            self._publish(self._course_record(result))
+
+    def finish(self, phase, error=None, reason=None):
+        """Ends the job; `reason` is a machine-readable failure reason, e.g. invalid_otp."""
+        if not self.finished:
+            self.phase = phase
+            self.error = error
+            self.reason = reason
+            self.finished_at = time.time()
+            self._publish(self.summary())
+
+    def _course_record(self, result):
+        return dict(result, type="course")
+
+    def summary(self):
+        summary = {
+            "type": "summary",
+            "job_id": self.id,
+            "status": self.phase,
+            "courses_done": self.courses_done,
+            "courses_total": self.courses_total,
+            "courses_with_results": len(self.results),
+        }
+        if self.provisioning is not None:
+            summary["provisioning"] = self.provisioning
+        if self.error:
+            summary["message"] = self.error
+        if self.reason:
+            summary["reason"] = self.reason
+        return summary
+
+    def subscribe(self):
+        """Returns a queue receiving a record per scraped course and a final summary.
+
+        Courses scraped before subscribing are replayed first.
+        """
+        queue = asyncio.Queue()
+        for result in self.results:
+            queue.put_nowait(self._course_record(result))
+        if self.finished:
+            queue.put_nowait(self.summary())
+        else:
+            self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    def _publish(self, record):
+        for queue in self._subscribers:
+            queue.put_nowait(record)
+        if record["type"] == "summary":
+            self._subscribers = []
+
+    def to_dict(self):
+        phase = self.phase
+        if phase == SCRAPING:
+            phase = f"{SCRAPING} {self.courses_done}/{self.courses_total}"
+        job = {
+            "job_id": self.id,
+            "session_id": self.session_id,
+            "status": self.phase,
+            "phase": phase,
+            "courses_done": self.courses_done,
+            "courses_total": self.courses_total,
+            # A copy: the results keep growing while the job runs
+            "data": list(self.results),
+        }
+        if self.provisioning is not None:
+            job["provisioning"] = self.provisioning
+        if self.error:
+            job["message"] = self.error
+        if self.reason:
+            job["reason"] = self.reason
+        return job
+
+
+class JobQueue:
+    """Runs queued job stages on a fixed number of asyncio worker tasks."""
+
+    def __init__(self, workers=None, result_ttl=None):
+        self.workers = max(1, workers or config.JOB_WORKERS)
+        self.result_ttl = config.JOB_RESULT_TTL if result_ttl is None else result_ttl
+        self.jobs = {}
+        self._queue = asyncio.Queue()
+        self._worker_tasks = []
+
+    async def start(self):
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for job in self.jobs.values():
+            if job.task and not job.task.done():
+                job.task.cancel()
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def create(self, session_id):
+        self.prune()
+        job = Job(session_id)
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        self.prune()
+        return self.jobs.get(job_id)
+
+    def submit(self, job, stage, on_error=None):
+        """Queues `stage(job)`; `on_error(job)` runs if the stage fails or is cancelled."""
+        job.set_phase(QUEUED)
+        self._queue.put_nowait((job, stage, on_error))
+
+    def queued(self):
+        """Number of stages waiting for a worker."""
+        return self._queue.qsize()
+
+    def cancel(self, job_id, reason=None):
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        job.cancel_reason = reason
+        if job.task and not job.task.done():
+            job.task.cancel()
+        else:
+            job.finish(CANCELLED, reason)
+        return job
+
+    def cancel_session(self, session_id, reason=None):
+        """Cancels every unfinished job of the session."""
+        for job in list(self.jobs.values()):
+            if job.session_id == session_id and not job.finished:
+                self.cancel(job.id, reason)
+
+    def prune(self):
+        expired_before = time.time() - self.result_ttl
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job.finished and job.finished_at < expired_before]:
+            del self.jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job, stage, on_error = await self._queue.get()
+            try:
+                if job.finished:
+                    continue
+                job.task = asyncio.create_task(stage(job))
+                await asyncio.wait({job.task})
+                if job.task.cancelled():
+                    job.finish(CANCELLED, job.cancel_reason)
+                elif job.task.exception() is not None:
+                    exception = job.task.exception()
+                    FAILURES.inc(phase=job.phase)
+                    job.finish(FAILED, str(exception), reason=getattr(exception, 'reason', None))
+                if job.finished and job.phase != DONE and on_error:
+                    try:
+                        await on_error(job)
+                    except Exception as e:
+                        print(f"Error cleaning up job {job.id}: {str(e)}")
+            finally:
+                job.task = None
+                self._queue.task_done()
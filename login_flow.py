@@ -0,0 +1,121 @@
+import asyncio
+
+import config
+
+# States of the Keycloak login as seen in the page
+PASSWORD_FORM = 'password_form'
+TRY_ANOTHER_WAY = 'try_another_way'
+AUTHENTICATOR_CHOICE = 'authenticator_choice'
+OTP_PROMPT = 'otp_prompt'
+ERROR_BANNER = 'error_banner'
+DASHBOARD = 'dashboard'
+
+# Failure reasons
+INVALID_CREDENTIALS = 'invalid_credentials'
+INVALID_OTP = 'invalid_otp'
+OTP_NOT_OFFERED = 'otp_not_offered'
+TIMEOUT = 'timeout'
+
+SELECTORS = {
+    ERROR_BANNER: '[id^="input-error"], .alert-error',
+    PASSWORD_FORM: 'input[name="password"]',
+    TRY_ANOTHER_WAY: 'a[id="try-another-way"]',
+    AUTHENTICATOR_CHOICE: "button[name='authenticationExecution']",
+    OTP_PROMPT: 'input[name="otp"]',
+}
+OTP_METHOD = "button[name='authenticationExecution']:has-text('Enter a verification code from authenticator application.')"
+DASHBOARD_URL = "**/ilias.php?baseClass=ilDashboardGUI&cmd=jumpToSelectedItems"
+
+
+class LoginFailedError(Exception):
+    """Raised when the login cannot continue; `reason` says why."""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+async def _wait_for_state(page, state):
+    if state == DASHBOARD:
+        await page.wait_for_url(DASHBOARD_URL, wait_until='commit', timeout=0)
+    else:
+        await page.wait_for_selector(SELECTORS[state], state='visible', timeout=0)
+    return state
+
+
+async def wait_for_any(page, states, timeout):
+    """Returns the first of `states` the page reaches, checking all of them at once.
+
+    When several are reached together the one listed first wins, so error
+    banners should come first. Raises LoginFailedError(TIMEOUT) if none is
+    reached within `timeout` seconds.
+    """
+    tasks = [asyncio.create_task(_wait_for_state(page, state)) for state in states]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if not done:
+        raise LoginFailedError(TIMEOUT, f"The login page did not respond within {timeout:g} seconds")
+    for task in tasks:
+        if task in done and not task.cancelled() and task.exception() is None:
+            return task.result()
+    # Every finished wait failed, e.g. because the page was closed
+    raise next(task.exception() for task in tasks if task in done and not task.cancelled())
+
+
+async def _error_text(page, default):
+    try:
+        text = (await page.locator(SELECTORS[ERROR_BANNER]).first.inner_text(timeout=1000)).strip()
+    except Exception:
+        text = ''
+    return text or default
+
+
+async def log_in(page, login_url, username, password, timeout=None, navigate=True):
+    """Drives the Keycloak login from `login_url` up to the OTP prompt.
+
+    Instead of fixed waits per step, every step waits for all states the page
+    can move to and acts on the first one that appears. Each step is taken at
+    most once, so the page that was just left is never mistaken for the next
+    one. Returns OTP_PROMPT, or DASHBOARD if no OTP was asked for. With
+    navigate=False the page is already on `login_url` (a prewarmed context).
+    """
+    timeout = config.LOGIN_STEP_TIMEOUT if timeout is None else timeout
+    if navigate:
+        await page.goto(login_url, wait_until='commit')
+    pending = [ERROR_BANNER, PASSWORD_FORM, TRY_ANOTHER_WAY, AUTHENTICATOR_CHOICE, OTP_PROMPT, DASHBOARD]
+    while True:
+        state = await wait_for_any(page, pending, timeout)
+        if state in (OTP_PROMPT, DASHBOARD):
+            return state
+        if state == ERROR_BANNER:
+            raise LoginFailedError(INVALID_CREDENTIALS, await _error_text(page, "Invalid username or password."))
+        pending.remove(state)
+        if state == PASSWORD_FORM:
+            await page.fill('input[name="username"]', username)
+            await page.fill('input[name="password"]', password)
+            await page.click('input[name="login"]')
+        elif state == TRY_ANOTHER_WAY:
+            await page.click(SELECTORS[TRY_ANOTHER_WAY])
+        elif state == AUTHENTICATOR_CHOICE:
+            if not await page.locator(OTP_METHOD).count():
+                raise LoginFailedError(OTP_NOT_OFFERED, "No authenticator app is set up for this account.")
+            await page.click(OTP_METHOD)
+            # The OTP method can no longer be reached through another way
+            if TRY_ANOTHER_WAY in pending:
+                pending.remove(TRY_ANOTHER_WAY)
+
+
+async def submit_otp(page, otp, timeout=None):
+    """Submits the OTP and returns as soon as the dashboard or an error shows up."""
+    timeout = config.LOGIN_DASHBOARD_TIMEOUT if timeout is None else timeout
+    await page.fill(SELECTORS[OTP_PROMPT], otp)
+    await page.click('input[type="submit"]')
+    state = await wait_for_any(page, [ERROR_BANNER, DASHBOARD], timeout)
+    if state == ERROR_BANNER:
+        raise LoginFailedError(INVALID_OTP, await _error_text(page, "Invalid authenticator code."))
+    print("Login successful. Redirecting to the target URL...")
+    return state
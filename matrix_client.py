@@ -0,0 +1,173 @@
+import asyncio
+import random
+
+import httpx
+
+import config
+from metrics import FAILURES, MATRIX_REQUEST_SECONDS
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def matrix_user_id(user_id):
+    return "@" + user_id + ":" + config.MATRIX_SERVER_NAME
+
+
+def user_id_from_email(email):
+    return email.split('@', 1)[0].strip().lower()
+
+
+def plan_memberships(memberships, known=()):
+    """Builds the inverted index {user_id: [room_name, ...]} of the memberships still to add.
+
+    The scraped rosters name the same student in many courses and, through
+    duplicate rows or several addresses, the same membership more than once.
+    Identical (user_id, room_name) pairs are kept once and pairs in `known`,
+    which already exist on the Matrix server, are dropped. add_user_to_rooms
+    takes one user and any number of rooms, so one call per user in the index
+    is the fewest calls that cover the rest. First-seen order is kept.
+
+    Returns the index and the counts behind it for the provisioning report.
+    """
+    rooms_by_user = {}
+    seen = set()
+    counts = {"memberships": 0, "duplicates": 0, "known": 0}
+    for membership in memberships:
+        counts["memberships"] += 1
+        if membership in seen:
+            counts["duplicates"] += 1
+            continue
+        seen.add(membership)
+        if membership in known:
+            counts["known"] += 1
+            continue
+        user_id, room_name = membership
+        rooms_by_user.setdefault(user_id, []).append(room_name)
+    return rooms_by_user, counts
+
+
+class MatrixProvisioningClient:
+    """Async client for the room provisioning service in front of the Matrix server.
+
+    Requests share one keep-alive connection pool, at most `max_in_flight` of
+    them run at once, and transport errors or 429/5xx answers are retried with
+    exponential backoff.
+    """
+
+    def __init__(self, base_url=None, max_in_flight=None, retries=None, backoff=None, client=None):
+        self.base_url = (base_url or config.MATRIX_BASE_URL).rstrip('/')
+        self.max_in_flight = max(1, max_in_flight or config.MATRIX_MAX_IN_FLIGHT)
+        self.retries = config.MATRIX_RETRIES if retries is None else retries
+        self.backoff = config.MATRIX_BACKOFF if backoff is None else backoff
+        self._client = client
+        self._owns_client = client is None
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+    @property
+    def client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=config.MATRIX_TIMEOUT,
+                limits=httpx.Limits(max_connections=self.max_in_flight,
+                                    max_keepalive_connections=self.max_in_flight),
+            )
+            self._owns_client = True
+        return self._client
+
+    async def close(self):
+        if self._client is not None and self._owns_client:
+            await self._client.aclose()
+        self._client = None
+
+    async def _post(self, path, data, report=None):
+        attempt = 0
+        while True:
+            if report is not None:
+                report["calls_executed"] += 1
+            try:
+                async with self._semaphore:
+                    with MATRIX_REQUEST_SECONDS.time(endpoint=path):
+                        response = await self.client.post(self.base_url + path, json=data)
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.retries:
+                    return response
+            except httpx.TransportError:
+                if attempt >= self.retries:
+                    raise
+            # Exponential backoff with jitter, outside the semaphore
+            await asyncio.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+            attempt += 1
+
+    async def add_user_to_rooms(self, user_id, room_names, report=None):
+        data = {
+            "user_id": matrix_user_id(user_id),
+            "rooms": [{"room_name": room_name} for room_name in room_names]
+        }
+        return await self._post("/add_user_to_rooms", data, report)
+
+    async def remove_user_from_rooms(self, user_id, room_names, report=None):
+        data = {
+            "user_id": matrix_user_id(user_id),
+            "rooms": [{"room_name": room_name} for room_name in room_names]
+        }
+        return await self._post("/remove_user_from_rooms", data, report)
+
+    async def _run_batched(self, memberships, call, known=()):
+        rooms_by_user, report = plan_memberships(memberships, known)
+        # calls_executed counts every request sent, retries included
+        report.update({"calls_planned": len(rooms_by_user), "calls_executed": 0, "provisioned": 0, "failed": 0})
+
+        async def run(user_id, room_names):
+            try:
+                response = await call(user_id, room_names, report)
+                response.raise_for_status()
+                return True
+            except httpx.HTTPError as e:
+                print(f"Error updating {user_id} in {len(room_names)} rooms: {str(e)}")
+                FAILURES.inc(phase='matrix')
+                return False
+
+        results = await asyncio.gather(*(run(user_id, room_names)
+                                         for user_id, room_names in rooms_by_user.items()))
+        failed = set()
+        for ok, (user_id, room_names) in zip(results, rooms_by_user.items()):
+            report["provisioned" if ok else "failed"] += len(room_names)
+            if not ok:
+                failed.update((user_id, room_name) for room_name in room_names)
+        return report, failed
+
+    async def add_memberships(self, memberships, known=()):
+        """Adds (user_id, room_name) memberships not in `known`, one call per user.
+
+        Returns the report and the set of memberships that failed.
+        """
+        return await self._run_batched(memberships, self.add_user_to_rooms, known)
+
+    async def remove_memberships(self, memberships):
+        return await self._run_batched(memberships, self.remove_user_from_rooms)
+
+    async def provision(self, memberships, known=()):
+        """Adds every (user_id, room_name) membership not in `known`, one call per user.
+
+        The report compares the scraped memberships, each of which used to be
+        a call of its own, with the calls planned and executed, and counts the
+        memberships that were provisioned or failed.
+        """
+        report, _ = await self.add_memberships(memberships, known)
+        return report
+
+
+def memberships_from_courses(all_email_column_data):
+    """Yields (user_id, room_name) pairs for the scraped course rosters."""
+    for course in all_email_column_data:
+        for email in course['emails']:
+            if email:
+                yield user_id_from_email(email), course['course_name']
+
+
+def merge_reports(*reports):
+    """Adds up the counts of several provisioning reports."""
+    merged = {}
+    for report in reports:
+        for key, value in report.items():
+            merged[key] = merged.get(key, 0) + value
+    return merged
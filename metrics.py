@@ -0,0 +1,196 @@
+import asyncio
+import bisect
+import time
+from contextlib import contextmanager
+
+# Seconds; covers fast HTML parses up to the 60 s dashboard wait
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_registry = []
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._series[key] = self._series.get(key, 0) + amount
+
+    def _samples(self):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+                for key, value in self._series.items()]
+
+
+class Gauge(_Metric):
+    """A gauge read from `callback()` at scrape time, so updating it costs nothing."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, callback):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def _samples(self):
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        return [f'{self.name} {_format_value(value)}']
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the block; failed attempts are left to FAILURES."""
+        start = time.perf_counter()
+        yield
+        self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", le)])} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _with_label(sample, label, value):
+    name_end = next((index for index, char in enumerate(sample) if char in '{ '), len(sample))
+    pair = f'{label}="{value}"'
+    if sample[name_end:name_end + 1] == '{':
+        return f'{sample[:name_end]}{{{pair},{sample[name_end + 1:]}'
+    return f'{sample[:name_end]}{{{pair}}}{sample[name_end:]}'
+
+
+def merge(expositions, label):
+    """Combines (source, text) expositions of several processes into one.
+
+    Every sample gets `label`="<source>"; the samples of a metric stay together
+    under a single HELP and TYPE line.
+    """
+    families = {}
+    for source, text in expositions:
+        family = families.setdefault('', ([], []))
+        for line in text.splitlines():
+            if line.startswith('#'):
+                parts = line.split(None, 3)
+                if len(parts) >= 3 and parts[1] in ('HELP', 'TYPE'):
+                    family = families.setdefault(parts[2], ([], []))
+                    if line not in family[0]:
+                        family[0].append(line)
+            elif line.strip():
+                family[1].append(_with_label(line, label, source))
+    lines = []
+    for headers, samples in families.values():
+        lines.extend(headers + samples)
+    return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+BROWSER_LAUNCH_SECONDS = Histogram(
+    'unisync_browser_launch_seconds', 'Time to launch a Chromium process.')
+LOGIN_PAGE_LOAD_SECONDS = Histogram(
+    'unisync_login_page_load_seconds', 'Time from opening the Keycloak login page to the OTP prompt.')
+OTP_WAIT_SECONDS = Histogram(
+    'unisync_otp_wait_seconds', 'Time the user took to submit the OTP.')
+DASHBOARD_REDIRECT_SECONDS = Histogram(
+    'unisync_dashboard_redirect_seconds', 'Time from submitting the OTP to the ILIAS dashboard.')
+COURSE_NAVIGATION_SECONDS = Histogram(
+    'unisync_course_navigation_seconds', 'Time to retrieve the roster of one course.', ['path'])
+HTML_PARSE_SECONDS = Histogram(
+    'unisync_html_parse_seconds', 'Time spent parsing ILIAS HTML.', ['page'])
+MATRIX_REQUEST_SECONDS = Histogram(
+    'unisync_matrix_request_seconds', 'Duration of a single Matrix provisioning request.', ['endpoint'])
+SCREENSHOT_SECONDS = Histogram(
+    'unisync_screenshot_seconds', 'Time to capture and encode one screenshot frame.')
+FAILURES = Counter(
+    'unisync_failures_total', 'Failed syncs, courses and Matrix calls by phase.', ['phase'])
+BROWSER_RECYCLES = Counter(
+    'unisync_browser_recycles_total', 'Browsers replaced by a fresh one, by reason.', ['reason'])
+REQUESTS_BLOCKED = Counter(
+    'unisync_requests_blocked_total', 'Browser requests aborted by the scrape profiles, by resource type.', ['type'])
+SESSIONS_REFUSED = Counter(
+    'unisync_sessions_refused_total', 'New sessions refused because they would exceed the memory budget.')
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    'unisync_event_loop_lag_seconds', 'How late the event loop resumed a sleeping task.',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+loop_lag = {"last": 0.0, "max": 0.0}
+Gauge('unisync_event_loop_lag_last_seconds', 'Event loop lag at the latest check.', lambda: loop_lag["last"])
+Gauge('unisync_event_loop_lag_max_seconds', 'Largest event loop lag seen.', lambda: loop_lag["max"])
+
+
+async def monitor_event_loop_lag(interval):
+    """Sleeps `interval` seconds at a time and records how much later than that it woke up.
+
+    Anything that blocks the loop (parsing, synchronous I/O) shows up as lag
+    for every other request handled by the process.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        EVENT_LOOP_LAG_SECONDS.observe(lag)
+        loop_lag["last"] = lag
+        loop_lag["max"] = max(loop_lag["max"], lag)
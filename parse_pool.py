@@ -0,0 +1,72 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+import extraction
+import roster_retrieval
+from metrics import HTML_PARSE_SECONDS
+
+_executor = None
+_processes = 0
+
+
+def start(processes=None):
+    """Starts the parser processes; with 0 processes pages are parsed in the event loop."""
+    global _executor, _processes
+    processes = config.PARSER_PROCESSES if processes is None else processes
+    if processes > 0 and _executor is None:
+        _processes = processes
+        # Spawned, not forked: the parent runs Playwright's threads and an event loop
+        _executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+
+
+async def prewarm():
+    """Starts the parser processes now rather than on the first parsed page."""
+    if _executor is not None:
+        loop = asyncio.get_running_loop()
+        # Every submit that finds no idle process spawns one, up to the pool size
+        await asyncio.gather(*(loop.run_in_executor(_executor, _ready) for _ in range(_processes)))
+
+
+def _ready():
+    return True
+
+
+def stop():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _run(page, parse, html_content):
+    global _executor
+    if _executor is None:
+        return parse(html_content)
+    # Only the HTML string goes to the pool and only the extracted lists come back
+    try:
+        with HTML_PARSE_SECONDS.time(page=page):
+            return await asyncio.get_running_loop().run_in_executor(_executor, parse, html_content)
+    except BrokenProcessPool:
+        print("Parser process died, restarting the pool")
+        _executor = None
+        start()
+        raise
+
+
+async def extract_courses(html_content):
+    return await _run('courses', extraction.extract_courses, html_content)
+
+
+async def extract_email_column_from_table(html_content):
+    return await _run('members', extraction.extract_email_column_from_table, html_content)
+
+
+async def parse_roster_stream(chunks):
+    """Drop-in for roster_retrieval.parse_roster_stream that parses in the pool."""
+    if _executor is None:
+        return await roster_retrieval.parse_roster_stream(chunks)
+    html_content = ''.join([chunk async for chunk in chunks])
+    return await _run('members', roster_retrieval.parse_roster_html, html_content)
@@ -0,0 +1,77 @@
+"""Memory use of process trees and of the host, read from /proc (Linux only).
+
+Elsewhere every function returns None, and callers skip their memory checks.
+"""
+import os
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _pids():
+    try:
+        return [int(entry) for entry in os.listdir('/proc') if entry.isdigit()]
+    except FileNotFoundError:
+        return None
+
+
+def _stat(pid):
+    """(parent pid, resident bytes) of `pid`."""
+    with open(f'/proc/{pid}/stat') as stat:
+        # The command name may contain spaces; the other fields follow its closing parenthesis
+        fields = stat.read().rsplit(')', 1)[1].split()
+    return int(fields[1]), int(fields[21]) * PAGE_SIZE
+
+
+def find_pid(marker):
+    """Pid of the topmost process with `marker` among its command line arguments."""
+    pids = _pids()
+    if pids is None:
+        return None
+    marker = marker.encode()
+    matches = {}
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as cmdline:
+                if marker in cmdline.read().split(b'\0'):
+                    matches[pid] = _stat(pid)[0]
+        except (OSError, IndexError, ValueError):
+            continue
+    for pid, parent in matches.items():
+        if parent not in matches:
+            return pid
+    return None
+
+
+def tree_rss(pids):
+    """Resident bytes of each of `pids` together with all its descendants; 0 for a process that is gone."""
+    all_pids = _pids()
+    if all_pids is None:
+        return None
+    children, rss = {}, {}
+    for pid in all_pids:
+        try:
+            parent, rss[pid] = _stat(pid)
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(pid)
+    totals = {}
+    for root in pids:
+        total, pending = 0, [root] if root in rss else []
+        while pending:
+            pid = pending.pop()
+            total += rss.get(pid, 0)
+            pending.extend(children.get(pid, []))
+        totals[root] = total
+    return totals
+
+
+def host_available_memory():
+    """MemAvailable of the host in bytes."""
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
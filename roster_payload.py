@@ -0,0 +1,109 @@
+"""Encoding of sync results for the job endpoint: the plain or the compact format, compressed.
+
+The plain format lists every course with its emails, so a student in ten
+courses is sent ten times. The compact format sends every member once, in
+a table, and each course refers to its members by their index in it:
+
+    {"members": ["a@x.de", "b@x.de"],
+     "courses": [{"course_name": "C1", "course_ref_id": "1", "members": [0, 1]}, ...]}
+
+Clients ask for it with ?format=compact or an Accept header naming
+COMPACT_MEDIA_TYPE. Either format is encoded with orjson when installed,
+and compressed with brotli or gzip when the client accepts it. Results of
+more than a few courses are encoded in a worker thread, off the event loop.
+"""
+import asyncio
+import gzip
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from fastapi.responses import Response
+
+from assets import accepted_encodings
+
+JSON_MEDIA_TYPE = "application/json"
+COMPACT_MEDIA_TYPE = "application/vnd.unisync.compact+json"
+# Smaller bodies fit in a packet or two anyway
+COMPRESS_MIN_BYTES = 1024
+# Quick levels: the body is compressed on every request
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 4
+# Results of up to this many courses encode in well under a millisecond, on the event loop
+INLINE_MAX_COURSES = 10
+
+
+def compact_courses(courses):
+    """The compact form of a list of course results (see the module docstring)."""
+    index = {}
+    compact = []
+    for course in courses:
+        entry = {key: value for key, value in course.items() if key != "emails"}
+        entry["members"] = [index.setdefault(email, len(index)) for email in course["emails"]]
+        compact.append(entry)
+    return {"members": list(index), "courses": compact}
+
+
+def expand_courses(payload):
+    """The course results back from their compact form."""
+    members = payload["members"]
+    courses = []
+    for entry in payload["courses"]:
+        course = {key: value for key, value in entry.items() if key != "members"}
+        course["emails"] = [members[i] for i in entry["members"]]
+        courses.append(course)
+    return courses
+
+
+def wants_compact(request, format=None):
+    return format == "compact" or COMPACT_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def dumps(content):
+    """Compact JSON as bytes, through orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def compress(body, accept_encoding):
+    """(body, Content-Encoding) with the best encoding the client accepts; None if left as is."""
+    if len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, GZIP_LEVEL), "gzip"
+    return body, None
+
+
+def encode_job(content, accept_encoding, compact=False):
+    """(body, media type, Content-Encoding) of a job status whose "data" holds course results."""
+    if compact:
+        content = dict(content, data=compact_courses(content["data"]))
+    body, encoding = compress(dumps(content), accept_encoding)
+    return body, COMPACT_MEDIA_TYPE if compact else JSON_MEDIA_TYPE, encoding
+
+
+async def job_response(request, content, compact=False):
+    """The job status as a response in the format and encoding `request` asks for.
+
+    `content["data"]` must not change meanwhile: a large one is encoded in a thread.
+    """
+    args = (content, request.headers.get("accept-encoding", ""), compact)
+    if len(content["data"]) > INLINE_MAX_COURSES:
+        body, media_type, encoding = await asyncio.to_thread(encode_job, *args)
+    else:
+        body, media_type, encoding = encode_job(*args)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=media_type, headers=headers)
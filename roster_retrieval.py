@@ -0,0 +1,186 @@
+import csv
+import re
+import time
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+import lxml.etree
+
+import config
+from extraction import MEMBERS_TABLE_CLASS
+from metrics import HTML_PARSE_SECONDS
+
+ROSTER_MODES = ('table', 'paged', 'export')
+
+_TABLE_NAV_SUFFIX = '_table_nav'
+_EMAIL_HEADER = re.compile(r'^e-?mail', re.IGNORECASE)
+
+
+class RosterStreamParser:
+    """Incremental parser for the course members table.
+
+    HTML is fed in chunks and the e-mail column of every row is returned as
+    soon as the row is complete; finished rows are removed from the tree, so a
+    large roster never exists as a whole DOM. The output matches
+    extract_email_column_from_table. Links of the table's pagination are
+    collected in `nav_links`.
+    """
+
+    def __init__(self):
+        self._parser = lxml.etree.HTMLPullParser(events=('start', 'end'))
+        self._table = None
+        self._tbody = None
+        self._tbody_done = False
+        self.nav_links = []
+
+    def feed(self, text):
+        self._parser.feed(text)
+        return self._read_rows()
+
+    def close(self):
+        self._parser.close()
+        return self._read_rows()
+
+    def _read_rows(self):
+        emails = []
+        for event, element in self._parser.read_events():
+            tag = element.tag
+            if not isinstance(tag, str):
+                continue
+            if event == 'start':
+                if tag == 'table' and self._table is None and element.get('class') == MEMBERS_TABLE_CLASS:
+                    self._table = element
+                elif (tag == 'tbody' and self._table is not None and self._tbody is None
+                      and not self._tbody_done and _is_descendant(element, self._table)):
+                    self._tbody = element
+            elif tag == 'a':
+                href = element.get('href')
+                if href and _TABLE_NAV_SUFFIX + '=' in href:
+                    self.nav_links.append(href)
+            elif tag == 'tr' and self._tbody is not None and element.getparent() is self._tbody:
+                # Nested rows end before their outer row; handle them all here in document order
+                for row in element.iter('tr'):
+                    columns = list(row.iter('td'))
+                    if len(columns) >= 5:
+                        emails.append(''.join(columns[4].itertext()).strip())
+                element.clear()
+                while element.getprevious() is not None:
+                    del self._tbody[0]
+            elif tag == 'tbody' and element is self._tbody:
+                self._tbody = None
+                self._tbody_done = True
+        return emails
+
+
+def _is_descendant(element, ancestor):
+    return any(parent is ancestor for parent in element.iterancestors())
+
+
+def _with_query(url, **params):
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key not in params]
+    query.extend(params.items())
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _nav_position(url):
+    """Returns (nav_parameter, offset) of a pagination link, or None."""
+    for key, value in parse_qsl(urlsplit(url).query, keep_blank_values=True):
+        if key.endswith(_TABLE_NAV_SUFFIX):
+            offset = value.rsplit(':', 1)[-1]
+            return key, int(offset) if offset.isdigit() else 0
+    return None
+
+
+def parse_roster_html(html_content):
+    """Parses a complete members page; returns (emails, nav_links)."""
+    parser = RosterStreamParser()
+    emails = parser.feed(html_content)
+    emails.extend(parser.close())
+    return emails, parser.nav_links
+
+
+async def parse_roster_stream(chunks):
+    """Parses the members table from an async iterator of HTML chunks."""
+    parser = RosterStreamParser()
+    emails = []
+    # Only the time spent in the parser counts, not waiting for the network
+    parse_seconds = 0.0
+    async for chunk in chunks:
+        start = time.perf_counter()
+        emails.extend(parser.feed(chunk))
+        parse_seconds += time.perf_counter() - start
+    start = time.perf_counter()
+    emails.extend(parser.close())
+    HTML_PARSE_SECONDS.observe(parse_seconds + time.perf_counter() - start, page='members')
+    return emails, parser.nav_links
+
+
+async def fetch_paged_roster(fetch_chunks, url, page_size=None, parse=None):
+    """Retrieves every page of a paginated members table.
+
+    `fetch_chunks(url)` returns an async iterator over the HTML of `url`. If the
+    first page has pagination links, the table is requested again with the
+    largest page size and any remaining pages are followed in offset order.
+    ilTable2GUI reads the page size from `<prefix>_trows` (the nav parameter
+    is `<prefix>_table_nav`), keeps it as a table property and starts over at
+    offset 0 whenever it is sent, so only the first request carries it.
+    `parse(chunks)` replaces parse_roster_stream, e.g. to parse elsewhere.
+    """
+    page_size = page_size or config.ROSTER_PAGE_SIZE
+    parse = parse or parse_roster_stream
+    emails, nav_links = await parse(fetch_chunks(url))
+    positions = [(link, _nav_position(link)) for link in nav_links]
+    positions = [(link, position) for link, position in positions if position]
+    if not positions:
+        return emails
+
+    nav_parameter = positions[0][1][0]
+    rows_parameter = nav_parameter[:-len(_TABLE_NAV_SUFFIX)] + '_trows'
+    first_link = urljoin(url, positions[0][0])
+    nav_value = dict(parse_qsl(urlsplit(first_link).query))[nav_parameter]
+    first_page = _with_query(first_link, **{
+        nav_parameter: nav_value.rsplit(':', 1)[0] + ':0' if ':' in nav_value else '0',
+        rows_parameter: str(page_size),
+    })
+
+    pages = {}
+    pending = {0: first_page}
+    while pending:
+        offset = min(pending)
+        page_url = pending.pop(offset)
+        pages[offset], nav_links = await parse(fetch_chunks(page_url))
+        for link in nav_links:
+            position = _nav_position(link)
+            if position and position[1] not in pages and position[1] not in pending:
+                pending[position[1]] = urljoin(url, link)
+
+    return [email for offset in sorted(pages) for email in pages[offset]]
+
+
+async def fetch_exported_roster(lines):
+    """Reads the e-mail column from an async iterator over the lines of a member export CSV."""
+    emails = []
+    delimiter = None
+    email_column = None
+    async for line in lines:
+        if not line.strip():
+            continue
+        if email_column is None:
+            delimiter = _sniff_delimiter(line)
+            header = next(csv.reader([line.lstrip('\ufeff')], delimiter=delimiter))
+            email_column = next((index for index, name in enumerate(header) if _EMAIL_HEADER.match(name.strip())), None)
+            if email_column is None:
+                raise ValueError("Member export has no e-mail column")
+            continue
+        row = next(csv.reader([line], delimiter=delimiter))
+        if len(row) > email_column and row[email_column].strip():
+            emails.append(row[email_column].strip())
+    return emails
+
+
+def _sniff_delimiter(line):
+    return ';' if line.count(';') > line.count(',') else ','
+
+
+def member_export_url(ref_id):
+    return config.MEMBER_EXPORT_URL.format(ref_id=ref_id)
@@ -0,0 +1,60 @@
+import hashlib
+import json
+import os
+
+import config
+from file_store import atomic_write
+
+
+def normalize_roster(emails):
+    return {email.strip().lower() for email in emails if email and email.strip()}
+
+
+def roster_hash(members):
+    return hashlib.sha256("\n".join(sorted(members)).encode()).hexdigest()
+
+
+class SnapshotStore:
+    """Last provisioned roster of every course, one JSON file per course refId."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or config.SNAPSHOT_DIR
+
+    def path(self, ref_id):
+        if not str(ref_id).isdigit():
+            raise ValueError(f"Invalid course refId {ref_id!r}")
+        return os.path.join(self.directory, f"{ref_id}.json")
+
+    def load(self, ref_id):
+        try:
+            with open(self.path(ref_id), encoding="utf-8") as snapshot_file:
+                return json.load(snapshot_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable snapshot for course {ref_id}: {str(e)}")
+            return None
+
+    def save(self, ref_id, room_name, members):
+        snapshot = {
+            "ref_id": str(ref_id),
+            "room_name": room_name,
+            "hash": roster_hash(members),
+            "members": sorted(members),
+        }
+        atomic_write(self.path(ref_id), json.dumps(snapshot))
+        return snapshot
+
+
+def diff_roster(snapshot, room_name, members):
+    """Returns (unchanged, added, removed) of `members` against the course snapshot.
+
+    A snapshot taken for a different room name does not count, so a renamed
+    course is provisioned in full into its new room.
+    """
+    if snapshot is None or snapshot.get("room_name") != room_name:
+        return False, set(members), set()
+    if snapshot["hash"] == roster_hash(members):
+        return True, set(), set()
+    known = set(snapshot["members"])
+    return False, members - known, known - members
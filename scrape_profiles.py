@@ -0,0 +1,101 @@
+from urllib.parse import urlsplit
+
+from metrics import REQUESTS_BLOCKED
+
+TRACKER_HOSTS = (
+    'google-analytics.com',
+    'googletagmanager.com',
+    'doubleclick.net',
+    'hotjar.com',
+    'matomo.cloud',
+)
+TRACKER_PATHS = ('matomo.js', 'piwik.js', 'matomo.php', 'piwik.php')
+
+
+class ScrapeProfile:
+    """Which requests a page may make; everything else is aborted."""
+
+    def __init__(self, name, allowed_types=None, blocked_types=(), block_trackers=True):
+        self.name = name
+        self.allowed_types = set(allowed_types) if allowed_types is not None else None
+        self.blocked_types = set(blocked_types)
+        self.block_trackers = block_trackers
+
+    def should_block(self, request):
+        if self.block_trackers and is_tracker(request.url):
+            return True
+        if self.allowed_types is not None:
+            return request.resource_type not in self.allowed_types
+        return request.resource_type in self.blocked_types
+
+
+PROFILES = {
+    # Keycloak needs its scripts and stylesheets to render and submit the form
+    # (and the user watches it through the screenshots); pictures and fonts are
+    # decoration.
+    'login': ScrapeProfile('login', blocked_types={'image', 'media', 'font'}),
+    # page.content() only needs the DOM
+    'scrape': ScrapeProfile('scrape', allowed_types={'document', 'xhr', 'fetch'}),
+}
+
+# Blocked requests are counted by resource type ('tracker' for trackers); their
+# size is unknown, as they are never sent.
+totals = {'requests': 0, 'requests_blocked': 0, 'blocked_by_type': {}}
+
+
+def is_tracker(url):
+    parts = urlsplit(url)
+    host = parts.hostname or ''
+    if any(host == tracker or host.endswith('.' + tracker) for tracker in TRACKER_HOSTS):
+        return True
+    return parts.path.rsplit('/', 1)[-1] in TRACKER_PATHS
+
+
+class SessionRouting:
+    """Routes every request of a BrowserContext through the current scrape profile.
+
+    Switching profiles only swaps `self.profile`; the route stays installed.
+    """
+
+    def __init__(self, profile='login'):
+        self.profile = PROFILES[profile]
+        self.requests = 0
+        self.requests_blocked = 0
+        self.blocked_by_type = {}
+
+    def set_profile(self, profile):
+        self.profile = PROFILES[profile]
+
+    async def install(self, context):
+        await context.route('**/*', self._handle)
+        return self
+
+    async def _handle(self, route):
+        request = route.request
+        self.requests += 1
+        if self.profile.should_block(request):
+            kind = 'tracker' if is_tracker(request.url) else request.resource_type
+            self.requests_blocked += 1
+            self.blocked_by_type[kind] = self.blocked_by_type.get(kind, 0) + 1
+            REQUESTS_BLOCKED.inc(type=kind)
+            await route.abort('blockedbyclient')
+        else:
+            await route.continue_()
+
+    def stats(self):
+        return {
+            'profile': self.profile.name,
+            'requests': self.requests,
+            'requests_blocked': self.requests_blocked,
+            'blocked_by_type': dict(self.blocked_by_type),
+        }
+
+    def add_to_totals(self):
+        totals['requests'] += self.requests
+        totals['requests_blocked'] += self.requests_blocked
+        for kind, count in self.blocked_by_type.items():
+            totals['blocked_by_type'][kind] = totals['blocked_by_type'].get(kind, 0) + count
+
+
+async def install_scrape_profiles(context, profile='login'):
+    return await SessionRouting(profile).install(context)
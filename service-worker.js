@@ -1,35 +1,42 @@
 // service-worker.js
+// Template: assets.py fills in the version and the precache list (python assets.py)
 
-const CACHE_NAME = 'uni-sync-cache-v1';
-const urlsToCache = [
-    '/',
-    '/index.html',
-    '/static/css/styles.css',
-    '/static/js/main.js',
-    '/manifest.json',
-    '/static/icons/icon.png',
-    '/static/icons/icon.png'
-];
+const CACHE_NAME = 'uni-sync-cache-__VERSION__';
+const urlsToCache = __PRECACHE_URLS__;
+const precached = new Set(urlsToCache);
 
 self.addEventListener('install', event => {
     event.waitUntil(
         caches.open(CACHE_NAME)
-            .then(cache => {
-                console.log('Opened cache');
-                return cache.addAll(urlsToCache);
-            })
+            .then(cache => cache.addAll(urlsToCache))
+            .then(() => self.skipWaiting())
     );
 });
 
 self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    // API calls, screenshots and anything not precached go to the network as usual
+    if (request.method !== 'GET' || url.origin !== self.location.origin || !precached.has(url.pathname)) {
+        return;
+    }
+    if (request.mode === 'navigate') {
+        // Pages: the network first so a deploy shows up, the cached copy when offline
+        event.respondWith(
+            fetch(request)
+                .then(response => {
+                    const copy = response.clone();
+                    caches.open(CACHE_NAME).then(cache => cache.put(request, copy));
+                    return response;
+                })
+                .catch(() => caches.match(request))
+        );
+        return;
+    }
+    // Assets carry their content hash in the name, so the cached copy is always current
     event.respondWith(
-        caches.match(event.request)
-            .then(response => {
-                if (response) {
-                    return response;  // return cached response if available
-                }
-                return fetch(event.request);  // else fetch from network
-            })
+        caches.match(request)
+            .then(response => response || fetch(request))
     );
 });
 
@@ -42,6 +49,6 @@ self.addEventListener('activate', event => {
                     return caches.delete(key);
                 }
             }))
-        )
+        ).then(() => self.clients.claim())
     );
 });
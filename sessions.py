@@ -0,0 +1,123 @@
+import asyncio
+import base64
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+import config
+
+
+class SessionLimitError(Exception):
+    """Raised when no session can be evicted to make room for a new one."""
+
+
+def session_id_for(username):
+    return base64.urlsafe_b64encode(username.encode()).decode()
+
+
+class SessionStore(MutableMapping):
+    """Dict of live browser sessions with an idle TTL and a maximum size.
+
+    Only ``touch`` counts as using a session, called on user actions (a new
+    sync, an OTP); reads such as screenshot watchers or metrics do not keep
+    a session alive. Sessions marked ``busy`` (a sync is
+    running on them) are never expired or evicted. Cleanup is async, so
+    expiry and eviction happen in ``reap`` and ``make_room`` rather than on
+    insertion.
+    """
+
+    def __init__(self, idle_ttl=None, max_sessions=None, eviction=None, reap_interval=None):
+        self.idle_ttl = config.SESSION_IDLE_TTL if idle_ttl is None else idle_ttl
+        self.max_sessions = max(1, max_sessions or config.SESSION_MAX)
+        self.eviction = eviction or config.SESSION_EVICTION
+        if self.eviction not in ('lru', 'oldest'):
+            raise ValueError(f"Unknown session eviction policy {self.eviction!r}, expected 'lru' or 'oldest'")
+        self.reap_interval = config.SESSION_REAP_INTERVAL if reap_interval is None else reap_interval
+        self._sessions = OrderedDict()
+        self._last_used = {}
+        self._reaper_task = None
+        self.created = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def touch(self, session_id):
+        """Marks the session as used now, restarting its idle TTL."""
+        self._last_used[session_id] = time.monotonic()
+        if self.eviction == 'lru':
+            self._sessions.move_to_end(session_id)
+
+    def __getitem__(self, session_id):
+        return self._sessions[session_id]
+
+    def __setitem__(self, session_id, session):
+        if session_id not in self._sessions:
+            self.created += 1
+        self._sessions[session_id] = session
+        self.touch(session_id)
+
+    def __delitem__(self, session_id):
+        del self._sessions[session_id]
+        del self._last_used[session_id]
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def __iter__(self):
+        return iter(list(self._sessions))
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def idle_seconds(self, session_id):
+        return time.monotonic() - self._last_used[session_id]
+
+    def _evictable(self):
+        return [session_id for session_id, session in self._sessions.items() if not session.get('busy')]
+
+    async def make_room(self, cleanup):
+        """Evicts sessions (oldest or least recently used first) until one more fits."""
+        while len(self._sessions) >= self.max_sessions:
+            candidates = self._evictable()
+            if not candidates:
+                raise SessionLimitError("Too many active sessions, please try again later")
+            self.evicted += 1
+            await cleanup(candidates[0])
+            self.pop(candidates[0], None)
+
+    async def reap(self, cleanup):
+        """Cleans up every session that has been idle for longer than the TTL."""
+        for session_id in self._evictable():
+            if session_id in self._sessions and self.idle_seconds(session_id) > self.idle_ttl:
+                self.expired += 1
+                try:
+                    await cleanup(session_id)
+                except Exception as e:
+                    print(f"Error expiring session {session_id}: {str(e)}")
+
+    def start_reaper(self, cleanup):
+        async def reaper():
+            while True:
+                await asyncio.sleep(self.reap_interval)
+                await self.reap(cleanup)
+
+        self._reaper_task = asyncio.create_task(reaper())
+
+    async def stop_reaper(self):
+        if self._reaper_task:
+            self._reaper_task.cancel()
+            try:
+                await self._reaper_task
+            except asyncio.CancelledError:
+                pass
+            self._reaper_task = None
+
+    def stats(self):
+        return {
+            "active": len(self._sessions),
+            "busy": len(self._sessions) - len(self._evictable()),
+            "created": self.created,
+            "evicted": self.evicted,
+            "expired": self.expired,
+            "max_sessions": self.max_sessions,
+            "idle_ttl": self.idle_ttl,
+        }
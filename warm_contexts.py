@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import config
+
+
+class WarmContextPool:
+    """Browser contexts opened ahead of time, each with its page on the Keycloak login form.
+
+    `open_page(url)` opens a context, navigates its page to `url` and returns
+    (context, page, routing). A login takes a warm context instead of opening
+    one and loading the form itself; the pool is topped up again in the
+    background. Contexts older than `max_age` are replaced, since Keycloak
+    drops the login attempt behind an open form after a while.
+    """
+
+    def __init__(self, open_page, url, size=None, max_age=None):
+        self.open_page = open_page
+        self.url = url
+        self.size = config.PREWARM_CONTEXTS if size is None else max(0, size)
+        self.max_age = config.PREWARM_MAX_AGE if max_age is None else max_age
+        # (context, page, routing, time opened), oldest first
+        self._warm = []
+        self._opening = 0
+        self._refill = asyncio.Event()
+        self._task = None
+        self.ready = asyncio.Event()
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    async def start(self):
+        """Fills the pool in the background; `ready` is set once the first fill is done."""
+        self._task = asyncio.create_task(self._maintain())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        warm, self._warm = self._warm, []
+        await asyncio.gather(*(self._close(entry) for entry in warm))
+
+    def take(self):
+        """Returns a warm (context, page, routing), or None if none is left."""
+        while self._warm:
+            entry = self._warm.pop(0)
+            self._refill.set()
+            if time.monotonic() - entry[3] <= self.max_age and not entry[1].is_closed():
+                self.hits += 1
+                return entry[:3]
+            asyncio.create_task(self._close(entry))
+        if self.size:
+            self.misses += 1
+        return None
+
+    async def _open(self):
+        self._opening += 1
+        try:
+            context, page, routing = await self.open_page(self.url)
+            self._warm.append((context, page, routing, time.monotonic()))
+        except Exception as e:
+            self.failures += 1
+            print(f"Could not prewarm a login page: {str(e)}")
+        finally:
+            self._opening -= 1
+
+    async def _close(self, entry):
+        try:
+            await entry[0].close()
+        except Exception as e:
+            print(f"Error closing a prewarmed context: {str(e)}")
+
+    def _drop_stale(self):
+        now = time.monotonic()
+        stale = [entry for entry in self._warm if now - entry[3] > self.max_age]
+        self._warm = [entry for entry in self._warm if now - entry[3] <= self.max_age]
+        for entry in stale:
+            asyncio.create_task(self._close(entry))
+
+    async def fill(self):
+        missing = self.size - len(self._warm) - self._opening
+        if missing > 0:
+            await asyncio.gather(*(self._open() for _ in range(missing)))
+
+    async def _maintain(self):
+        try:
+            await self.fill()
+        finally:
+            self.ready.set()
+        while True:
+            try:
+                await asyncio.wait_for(self._refill.wait(), timeout=max(1.0, self.max_age / 2))
+            except asyncio.TimeoutError:
+                pass
+            self._refill.clear()
+            self._drop_stale()
+            await self.fill()
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "warm": len(self._warm),
+            "ready": self.ready.is_set(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "failures": self.failures,
+        }
@@ -0,0 +1,201 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from urllib.parse import quote
+
+import httpx
+
+import config
+
+
+class WorkerUnavailableError(Exception):
+    """Raised when no browser worker has room for a new session."""
+
+
+class BrowserWorker:
+    """One app process with its own browser pool, reached over a unix socket."""
+
+    def __init__(self, index, socket_dir=None, app_target=None):
+        self.index = index
+        self.socket_path = os.path.join(socket_dir or config.GATEWAY_SOCKET_DIR, f"worker-{index}.sock")
+        self.app_target = app_target or config.GATEWAY_WORKER_APP
+        self.process = None
+        self.capacity = None
+        self.restarts = 0
+        # No read timeout: result streams stay open for the whole sync
+        self.client = httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=self.socket_path),
+                                        base_url="http://worker", timeout=httpx.Timeout(config.HTTP_TIMEOUT, read=None))
+
+    def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        env = dict(os.environ, UNISYNC_WORKER_ID=str(self.index))
+        self.process = subprocess.Popen([sys.executable, "-m", "uvicorn", self.app_target,
+                                         "--uds", self.socket_path, "--log-level", "warning"], env=env)
+        self.capacity = None
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    @property
+    def available(self):
+        return self.alive and self.capacity is not None
+
+    async def refresh_capacity(self):
+        try:
+            response = await self.client.get("/worker/capacity", timeout=5)
+            response.raise_for_status()
+            self.capacity = response.json()
+        except (httpx.HTTPError, ValueError):
+            self.capacity = None
+        return self.capacity
+
+    async def stop(self):
+        await self.client.aclose()
+        if self.alive:
+            self.process.terminate()
+            try:
+                await asyncio.to_thread(self.process.wait, 15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def stats(self):
+        return {
+            "worker": self.index,
+            "pid": self.process.pid if self.process else None,
+            "alive": self.alive,
+            "restarts": self.restarts,
+            "capacity": self.capacity,
+        }
+
+
+class WorkerPool:
+    """Browser worker processes and the routing of sessions and jobs to them.
+
+    A session and its jobs stay on the worker that opened the session, since
+    its browser context lives there. New sessions go to the worker with the
+    fewest sessions among those with room, according to the capacity each
+    worker reports. Routes the gateway does not know (e.g. after a restart of
+    the gateway) are looked up by asking every worker.
+    """
+
+    def __init__(self, size=None, socket_dir=None, app_target=None, capacity_interval=None):
+        self.size = max(1, size or config.GATEWAY_WORKERS)
+        self.socket_dir = socket_dir or config.GATEWAY_SOCKET_DIR
+        self.capacity_interval = (config.GATEWAY_CAPACITY_INTERVAL if capacity_interval is None
+                                  else capacity_interval)
+        self.workers = [BrowserWorker(index, self.socket_dir, app_target) for index in range(self.size)]
+        # session_id / job_id -> (worker, time of last use)
+        self.sessions = {}
+        self.jobs = {}
+        self._next = 0
+        self._monitor_task = None
+
+    async def start(self):
+        os.makedirs(self.socket_dir, exist_ok=True)
+        for worker in self.workers:
+            worker.start()
+        await asyncio.gather(*(self._wait_until_up(worker) for worker in self.workers))
+        self._monitor_task = asyncio.create_task(self._monitor())
+
+    async def stop(self):
+        if self._monitor_task:
+            self._monitor_task.cancel()
+            try:
+                await self._monitor_task
+            except asyncio.CancelledError:
+                pass
+            self._monitor_task = None
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+
+    async def _wait_until_up(self, worker, timeout=None):
+        deadline = time.monotonic() + (config.GATEWAY_WORKER_START_TIMEOUT if timeout is None else timeout)
+        while time.monotonic() < deadline:
+            if not worker.alive:
+                raise RuntimeError(f"Browser worker {worker.index} exited with status {worker.process.returncode}")
+            if await worker.refresh_capacity() is not None:
+                return
+            await asyncio.sleep(0.2)
+        raise TimeoutError(f"Browser worker {worker.index} did not start")
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(self.capacity_interval)
+            for worker in self.workers:
+                if worker.process is not None and not worker.alive:
+                    print(f"Browser worker {worker.index} exited, restarting...")
+                    self._forget(worker)
+                    worker.restarts += 1
+                    worker.start()
+            await asyncio.gather(*(worker.refresh_capacity() for worker in self.workers if worker.alive))
+            self._prune()
+
+    def _forget(self, worker):
+        for table in (self.sessions, self.jobs):
+            for key in [key for key, (owner, _) in table.items() if owner is worker]:
+                del table[key]
+
+    def _prune(self):
+        # Forgotten routes are found again by asking the workers, so this only bounds memory
+        expired_before = time.monotonic() - max(config.SESSION_IDLE_TTL, config.JOB_RESULT_TTL)
+        for table in (self.sessions, self.jobs):
+            for key in [key for key, (_, used) in table.items() if used < expired_before]:
+                del table[key]
+
+    def route_session(self, session_id, worker):
+        self.sessions[session_id] = (worker, time.monotonic())
+
+    def route_job(self, job_id, worker):
+        self.jobs[job_id] = (worker, time.monotonic())
+
+    def place(self, session_id):
+        """Worker for a new login: the one already holding `session_id` (so the old
+        session is replaced), otherwise the least loaded worker with room.
+        Workers still prewarming are only used when no other has room."""
+        route = self.sessions.get(session_id)
+        if route and route[0].available:
+            self.route_session(session_id, route[0])
+            return route[0]
+        candidates = [worker for worker in self.workers if worker.available and worker.capacity["free"] > 0]
+        if not candidates:
+            raise WorkerUnavailableError("All browser workers are at capacity, please try again later")
+        worker = min(candidates, key=lambda worker: (not worker.capacity.get("ready", True),
+                                                     worker.capacity["sessions"] / max(1, worker.capacity["max_sessions"]),
+                                                     worker.capacity["contexts"]))
+        # Count the session now, so a burst of logins is spread before the next report
+        worker.capacity["sessions"] += 1
+        self.route_session(session_id, worker)
+        return worker
+
+    def any_worker(self):
+        """A worker for requests that are not tied to a session, in turn."""
+        workers = [worker for worker in self.workers if worker.available] or [worker for worker in self.workers if worker.alive]
+        if not workers:
+            raise WorkerUnavailableError("No browser worker is running")
+        self._next = (self._next + 1) % len(workers)
+        return workers[self._next]
+
+    async def _lookup(self, table, key, path):
+        route = table.get(key)
+        if route and route[0].alive:
+            table[key] = (route[0], time.monotonic())
+            return route[0]
+        workers = [worker for worker in self.workers if worker.alive]
+        responses = await asyncio.gather(*(worker.client.get(path) for worker in workers), return_exceptions=True)
+        for worker, response in zip(workers, responses):
+            if not isinstance(response, Exception) and response.status_code < 400:
+                table[key] = (worker, time.monotonic())
+                return worker
+        return None
+
+    async def session_owner(self, session_id):
+        return await self._lookup(self.sessions, session_id, f"/worker/sessions/{quote(session_id, safe='')}")
+
+    async def job_owner(self, job_id):
+        return await self._lookup(self.jobs, job_id, f"/jobs/{quote(job_id, safe='')}")
+
+    def stats(self):
+        return [worker.stats() for worker in self.workers]